@@ -1,95 +1,75 @@
 import os
+import hashlib
 import numpy as np
 import pandas as pd
-import pandas as pd
 import geopandas as gpd
-from scipy.spatial import Voronoi
+from scipy.spatial import Voronoi, cKDTree
 from shapely.geometry import Polygon
 from utils.states_codes import state_fips_to_abbr, state_alpha_to_fips
+from utils.storage import save_dataframe, read_dataframe, dataset_exists, apply_schema
+from utils.keys import add_county_fips, add_station_key
+from utils.geometry_store import load_layer, to_projected, projected_centroids, layer_fingerprint
 from dotenv import load_dotenv
 
 load_dotenv()
 
 source_data_directory = os.environ.get("SOURCE_DATA_DIRECTORY")
 shape_files = "shape_files"
+# "kdtree" o "voronoi" (ver assign_scan_station_to_cb_yield_counties)
+station_assignment_method = os.environ.get("STATION_ASSIGNMENT_METHOD", "kdtree")
+# Última asignación condado -> estación calculada (ver assignment_key)
+assignment_index_name = "county_station_assignment"
 
-# 1) Leer el shapefile de condados
-counties_gdf = gpd.read_file("shape_files/country/cb_2018_us_county_500k.shp")  # Ejemplo
+# 1) Los condados se leen del almacén GeoParquet (utils/geometry_store.py) al primer uso,
+#    con las proyecciones y los centroides ya calculados
 
-def get_counties_centroids(crop_yield_df, state_fips_to_abbr):
+def get_cornbelt_counties(state_fips_to_abbr):
+    """Condados de los estados de `state_fips_to_abbr`, del almacén de geometrías."""
     corn_belt_fips = list(state_fips_to_abbr.keys())
-    
-    # 2) Filtramos
-    counties_cornbelt = counties_gdf[counties_gdf["STATEFP"].isin(corn_belt_fips)]
+    counties_gdf = load_layer("counties")
+    return counties_gdf[counties_gdf["STATEFP"].isin(corn_belt_fips)].copy()
 
-    # Reproyectamos a un CRS apropiado (p.ej. Albers)
-    counties_cornbelt_proj = counties_cornbelt.to_crs(epsg=5070)
-
-    # Ahora calculamos centroides en coordenadas proyectadas (metros)
-    counties_cornbelt_proj["centroid"] = counties_cornbelt_proj.geometry.centroid
+def get_counties_centroids(crop_yield_df, state_fips_to_abbr, counties=None):
+    # `counties` puede ser cualquier tabla con STATEFP, COUNTYFP y lat/lon_centroid,
+    # p. ej. la asignación de assign_scan_station_to_cb_yield_counties: así no hace
+    # falta cargar las geometrías
 
-    # 3) Reproyectar el GeoDataFrame principal (que todavía contiene polígonos, no centroides)
-    counties_cornbelt_wgs84 = counties_cornbelt_proj.to_crs(epsg=4326)
-
-    # 4) Calcular centroides con la nueva geometría en EPSG:4326
-    counties_cornbelt_wgs84["centroid_wgs84"] = counties_cornbelt_wgs84.geometry.centroid
+    # 2) Filtramos
+    if counties is None:
+        counties_cornbelt_wgs84 = get_cornbelt_counties(state_fips_to_abbr)
+    else:
+        counties_cornbelt_wgs84 = counties.copy()
 
-    # Extraer lat/lon
-    # 5) Extraer lat/lon
-    counties_cornbelt_wgs84["lat_centroid"] = counties_cornbelt_wgs84["centroid_wgs84"].y
-    counties_cornbelt_wgs84["lon_centroid"] = counties_cornbelt_wgs84["centroid_wgs84"].x
+    # 3-5) lat_centroid/lon_centroid vienen precalculados (centroide en EPSG:4326 de
+    #      la geometría reproyectada desde EPSG:5070)
 
     # 6 Crear la columna STATEFP a partir de state_alpha
     crop_yield_df["STATEFP"] = crop_yield_df["state_alpha"].map(state_alpha_to_fips)
     crop_yield_df["COUNTYFP"] = crop_yield_df["county_code"].astype(str).str.zfill(3)
     counties_cornbelt_wgs84["COUNTYFP"] = counties_cornbelt_wgs84["COUNTYFP"].astype(str).str.zfill(3)
 
+    # Join sobre el FIPS de 5 dígitos como entero (utils/keys.py)
+    crop_yield_df = add_county_fips(crop_yield_df)
+    counties_cornbelt_wgs84 = add_county_fips(counties_cornbelt_wgs84)
     counties_centroids = crop_yield_df.merge(
-        counties_cornbelt_wgs84[["STATEFP", "COUNTYFP", "lat_centroid", "lon_centroid"]],
-        on=["STATEFP", "COUNTYFP"],
+        counties_cornbelt_wgs84[["county_fips", "lat_centroid", "lon_centroid"]],
+        on="county_fips",
         how="left"
     )
     return counties_centroids, counties_cornbelt_wgs84
 
 def save_counties_centroids(counties_centroids):
-    counties_centroids.to_csv(f'{source_data_directory}/counties_centroids.csv')
+    save_dataframe(counties_centroids, 'counties_centroids')
 
 def get_counties_centroids_cornbelt(counties_centroids):
     centroids_cornbelt_counties_crop_yield = counties_centroids.dropna(subset=["lat_centroid", "lon_centroid"])
     return centroids_cornbelt_counties_crop_yield
 
 def save_counties_centroids_cornbelt(centroids_cornbelt_counties_crop_yield):
-    centroids_cornbelt_counties_crop_yield.to_csv(f"{source_data_directory}/centroids_cornbelt_counties_crop_yield.csv")
-
-def assign_scan_station_to_cb_yield_counties(counties_cornbelt_wgs84, stations_df):
-    #########################################
-    ###########Cruce con Voronoi#############
-    #########################################
-
-    # 1) Reproyectar condados a CRS proyectado
-    counties_cornbelt_proj = counties_cornbelt_wgs84.to_crs(epsg=5070)
-    print("CRS antes de reproyectar:", counties_cornbelt_wgs84.crs)
-    # Asegura que esté en EPSG:4326
-    if counties_cornbelt_wgs84.crs is None:
-        counties_cornbelt_wgs84 = counties_cornbelt_wgs84.set_crs("EPSG:4326")
-    elif counties_cornbelt_wgs84.crs.to_string() != "EPSG:4326":
-        counties_cornbelt_wgs84 = counties_cornbelt_wgs84.to_crs(epsg=4326)
-
-    # ------------------------------------------------------------------------
-    # 2. Reproyectar condados a un sistema planar (por ej. EPSG:5070 Albers)
-    # ------------------------------------------------------------------------
-    counties_cornbelt_proj = counties_cornbelt_wgs84.to_crs(epsg=5070)
-
-    # ------------------------------------------------------------------------
-    # 3. Calcular centroides en la proyección (para sjoin con Voronoi luego)
-    # ------------------------------------------------------------------------
-    counties_cornbelt_proj["centroid"] = counties_cornbelt_proj.geometry.centroid
-    centroids_gdf = counties_cornbelt_proj.copy()
-    centroids_gdf["geometry"] = centroids_gdf["centroid"]
+    save_dataframe(centroids_cornbelt_counties_crop_yield, "centroids_cornbelt_counties_crop_yield")
 
-    # ------------------------------------------------------------------------
-    # 4. Cargar y reproyectar las estaciones (de stations.xlsx)
-    # ------------------------------------------------------------------------
+def project_stations(stations_df):
+    """Estaciones como puntos en EPSG:5070, con `station_idx` = posición en `stations_df`."""
     # Asumimos que las columnas son "latitude" y "longitude".
     stations_gdf = gpd.GeoDataFrame(
         stations_df,
@@ -102,14 +82,43 @@ def assign_scan_station_to_cb_yield_counties(counties_cornbelt_wgs84, stations_d
 
     stations_proj = stations_gdf.to_crs(epsg=5070)
     stations_proj["station_idx"] = range(len(stations_proj))  # Identificador interno
-
+    return stations_proj
+
+def _xy(points):
+    return np.column_stack((points.x, points.y))
+
+def nearest_stations(centroids_xy, stations_xy, k=1):
+    """
+    Las k estaciones más cercanas a cada centroide, en una sola consulta a un KD-tree.
+
+    Parámetros:
+        centroids_xy (np.ndarray): Coordenadas proyectadas (n, 2) de los centroides, en metros.
+        stations_xy (np.ndarray): Coordenadas proyectadas (m, 2) de las estaciones, en metros.
+        k (int, opcional): Número de vecinos (se limita al número de estaciones).
+
+    Retorna:
+        tuple: (distancias, índices), ambos de forma (n, k) y ordenados de la más
+        cercana a la más lejana. Los índices son posiciones en `stations_xy`.
+    """
+    k = min(k, len(stations_xy))
+    distances, indices = cKDTree(stations_xy).query(centroids_xy, k=k)
+    return distances.reshape(len(centroids_xy), k), indices.reshape(len(centroids_xy), k)
+
+def _assign_by_kdtree(centroids_gdf, stations_proj):
+    # La celda de Voronoi de una estación es justamente el conjunto de puntos más
+    # cercanos a ella: el vecino más cercano da la misma asignación sin construir
+    # ni recortar polígonos, y todos los condados reciben estación
+    distances, indices = nearest_stations(_xy(centroids_gdf.geometry), _xy(stations_proj.geometry), k=1)
+    joined = centroids_gdf.copy()
+    joined["station_idx"] = indices[:, 0]
+    joined["distance_km"] = distances[:, 0] / 1000
+    return joined
+
+def _assign_by_voronoi(counties_cornbelt_proj, centroids_gdf, stations_proj):
     # ------------------------------------------------------------------------
     # 5. Generar el Voronoi con scipy.spatial
     # ------------------------------------------------------------------------
-    points_array = np.column_stack((
-        stations_proj.geometry.x,
-        stations_proj.geometry.y
-    ))
+    points_array = _xy(stations_proj.geometry)
     vor = Voronoi(points_array)
 
     # ------------------------------------------------------------------------
@@ -156,17 +165,159 @@ def assign_scan_station_to_cb_yield_counties(counties_cornbelt_wgs84, stations_d
         how="left",
         predicate="within"    # O "op='within'" en versiones < 0.10
     )
+    return joined
+
+def _project_counties(counties_cornbelt_wgs84):
+    """Condados en EPSG:5070 y sus centroides como geometría."""
+    if "geometry_5070" in counties_cornbelt_wgs84.columns:
+        # Condados del almacén de geometrías: no hace falta reproyectar
+        counties_cornbelt_proj = to_projected(counties_cornbelt_wgs84)
+        counties_cornbelt_proj["centroid"] = projected_centroids(counties_cornbelt_proj)
+        centroids_gdf = counties_cornbelt_proj.copy()
+        centroids_gdf["geometry"] = centroids_gdf["centroid"]
+        return counties_cornbelt_proj, centroids_gdf
+
+    print("CRS antes de reproyectar:", counties_cornbelt_wgs84.crs)
+    # Asegura que esté en EPSG:4326
+    if counties_cornbelt_wgs84.crs is None:
+        counties_cornbelt_wgs84 = counties_cornbelt_wgs84.set_crs("EPSG:4326")
+    elif counties_cornbelt_wgs84.crs.to_string() != "EPSG:4326":
+        counties_cornbelt_wgs84 = counties_cornbelt_wgs84.to_crs(epsg=4326)
+
+    # ------------------------------------------------------------------------
+    # 2. Reproyectar condados a un sistema planar (por ej. EPSG:5070 Albers)
+    # ------------------------------------------------------------------------
+    counties_cornbelt_proj = counties_cornbelt_wgs84.to_crs(epsg=5070)
+
+    # ------------------------------------------------------------------------
+    # 3. Calcular centroides en la proyección
+    # ------------------------------------------------------------------------
+    counties_cornbelt_proj["centroid"] = counties_cornbelt_proj.geometry.centroid
+    centroids_gdf = counties_cornbelt_proj.copy()
+    centroids_gdf["geometry"] = centroids_gdf["centroid"]
+    return counties_cornbelt_proj, centroids_gdf
+
+def get_county_station_neighbors(counties_cornbelt_wgs84, stations_df, k=4):
+    """
+    Tabla larga con las k estaciones más cercanas a cada condado.
+
+    Retorna:
+        pd.DataFrame: county_fips, rank (0 = la más cercana), station_key y distance_km.
+    """
+    _, centroids_gdf = _project_counties(counties_cornbelt_wgs84)
+    stations_proj = add_station_key(project_stations(stations_df))
+    distances, indices = nearest_stations(_xy(centroids_gdf.geometry), _xy(stations_proj.geometry), k=k)
+    county_keys = add_county_fips(centroids_gdf)["county_fips"].to_numpy()
+    n_counties, k = indices.shape
+    return pd.DataFrame({
+        "county_fips": np.repeat(county_keys, k),
+        "rank": np.tile(np.arange(k, dtype="int8"), n_counties),
+        "station_key": stations_proj["station_key"].to_numpy()[indices.ravel()],
+        "distance_km": (distances.ravel() / 1000).astype("float32"),
+    })
+
+#################################################
+#####Caché de la asignación condado-estación#####
+#################################################
+# La asignación solo cambia si cambian las estaciones, los condados o el método.
+# La última calculada se guarda en la tabla `county_station_assignment` con una
+# columna `assignment_key` (hash de las tres cosas); cada asignación nueva
+# reemplaza a la anterior. La llave de los condados del almacén de geometrías se
+# calcula con el contenido del shapefile, así que si la llave coincide la
+# asignación se devuelve sin cargar ni reproyectar ninguna geometría.
+
+def assignment_key(stations_df, method, counties_gdf=None):
+    """
+    Hash del conjunto de estaciones (triplet y coordenadas), de los condados y del método.
+    Sin `counties_gdf` los condados son los del Corn Belt en el almacén de geometrías.
+    """
+    digest = hashlib.sha256(method.encode("utf-8"))
+    stations = pd.DataFrame({
+        "stationTriplet": stations_df["stationTriplet"].astype(str).to_numpy(),
+        "latitude": pd.to_numeric(stations_df["latitude"]).to_numpy(dtype="float64"),
+        "longitude": pd.to_numeric(stations_df["longitude"]).to_numpy(dtype="float64"),
+    }).sort_values("stationTriplet")
+    digest.update(pd.util.hash_pandas_object(stations, index=False).to_numpy().tobytes())
+    if counties_gdf is None:
+        digest.update(layer_fingerprint("counties").encode("utf-8"))
+        digest.update(",".join(sorted(state_fips_to_abbr)).encode("utf-8"))
+        return digest.hexdigest()[:16]
+    counties = add_county_fips(counties_gdf)
+    digest.update(str(counties.crs).encode("utf-8"))
+    for wkb in counties.geometry.to_wkb().to_numpy()[np.argsort(counties["county_fips"].to_numpy(), kind="stable")]:
+        digest.update(wkb)
+    return digest.hexdigest()[:16]
+
+def read_cached_assignment(key):
+    """Asignación guardada con `key`, o None si no existe (o si la guardada es otra)."""
+    if not dataset_exists(assignment_index_name):
+        return None
+    cached = read_dataframe(assignment_index_name)
+    if cached.empty or not (cached["assignment_key"] == key).all():
+        return None
+    return cached.drop(columns=["assignment_key"])
+
+def save_cached_assignment(assignment, key):
+    """Guarda la asignación `key` en lugar de la anterior."""
+    save_dataframe(assignment.assign(assignment_key=key), assignment_index_name)
+
+def assign_scan_station_to_cb_yield_counties(stations_df, counties_cornbelt_wgs84=None, method=None, use_cache=True):
+    """
+    Asigna a cada condado la estación SCAN más cercana a su centroide.
+
+    Parámetros:
+        stations_df (pd.DataFrame): Estaciones con latitude/longitude.
+        counties_cornbelt_wgs84 (gpd.GeoDataFrame, opcional): Condados del Corn Belt.
+            Por defecto se cargan del almacén de geometrías, solo si la asignación
+            no está guardada.
+        method (str, opcional): "kdtree" (vecino más cercano, cubre todos los condados)
+            o "voronoi" (polígonos recortados al Corn Belt + sjoin, deja sin estación
+            los condados de las celdas infinitas). Por defecto STATION_ASSIGNMENT_METHOD.
+        use_cache (bool, opcional): Reutiliza la asignación guardada si las estaciones
+            y los condados no cambiaron.
+
+    Retorna:
+        pd.DataFrame: Una fila por condado con sus columnas (incluidos los centroides)
+        y las de su estación, sin geometrías y con el esquema de utils/storage.py,
+        lista para `get_counties_centroids` y `merge_counties_crop_yield_with_scan_stations`.
+    """
+    method = method or station_assignment_method
+    if method not in {"kdtree", "voronoi"}:
+        raise ValueError(f"Método de asignación desconocido: {method}")
+
+    key = assignment_key(stations_df, method, counties_cornbelt_wgs84)
+    if use_cache:
+        cached = read_cached_assignment(key)
+        if cached is not None:
+            print(f"Asignación condado-estación {key} leída de {assignment_index_name}")
+            return cached
+    if counties_cornbelt_wgs84 is None:
+        counties_cornbelt_wgs84 = get_cornbelt_counties(state_fips_to_abbr)
+
+    # 1-3) Condados y centroides en EPSG:5070
+    counties_cornbelt_proj, centroids_gdf = _project_counties(counties_cornbelt_wgs84)
+
+    # ------------------------------------------------------------------------
+    # 4. Cargar y reproyectar las estaciones (de stations.xlsx)
+    # ------------------------------------------------------------------------
+    stations_proj = project_stations(stations_df)
 
-    # En 'joined' aparece 'station_idx' indicando la estación más cercana.
+    # 5-8) En 'joined' aparece 'station_idx' indicando la estación más cercana.
+    if method == "kdtree":
+        joined = _assign_by_kdtree(centroids_gdf, stations_proj)
+    else:
+        joined = _assign_by_voronoi(counties_cornbelt_proj, centroids_gdf, stations_proj)
 
     # ------------------------------------------------------------------------
     # 9. Vincular con datos de la estación (nombre, ID, etc.)
     # ------------------------------------------------------------------------
+    stations_proj = add_station_key(stations_proj)
     joined = joined.merge(
-        stations_proj[["station_idx", "stationTriplet", "stationId", "latitude", "longitude", "name"]], 
+        stations_proj[["station_idx", "stationTriplet", "stationId", "latitude", "longitude", "name", "station_key"]], 
         on="station_idx",
         how="left"
     )
+    joined = add_county_fips(joined)
 
     # ------------------------------------------------------------------------
     # 10. Unir con tu DataFrame de rendimiento, si aún no lo has hecho
@@ -185,12 +336,15 @@ def assign_scan_station_to_cb_yield_counties(counties_cornbelt_wgs84, stations_d
     # Quitar la columna "centroid" para que solo quede la geometría principal
     print(joined.columns)
 
-    joined_single_geom = joined.drop(columns=["centroid","centroid_wgs84"])  
+    joined_single_geom = joined.drop(columns=["centroid", "centroid_wgs84"], errors="ignore")  
 
     # Ahora sí, esto guardará sin problema
     os.makedirs(f'{shape_files}/counties_usda', exist_ok=True)
     joined_single_geom.to_file(f"{shape_files}/counties_usda/cornbelt_counties_nearest_usda_station.shp")
 
-    # Para CSV, debes quitar la geometría (por ejemplo joined.drop(columns="geometry"))
-    joined.drop(columns="geometry").to_csv(f"{source_data_directory}/cornbelt_counties_nearest_usda_station.csv", index=False)
-    return joined
\ No newline at end of file
+    # Para la tabla se quitan todas las columnas de geometría (geometry, centroid, centroid_wgs84)
+    geometry_columns = [c for c in joined.columns if isinstance(joined[c], gpd.GeoSeries)]
+    assignment = apply_schema(pd.DataFrame(joined.drop(columns=geometry_columns)).reset_index(drop=True))
+    save_dataframe(assignment, "cornbelt_counties_nearest_usda_station")
+    save_cached_assignment(assignment, key)
+    return assignment
\ No newline at end of file
@@ -1,8 +1,15 @@
-from data.get_scan_data import get_usda_stations, filter_scan_data, get_usda_weather_data
+from data.get_scan_data import get_usda_stations, filter_scan_data, get_usda_weather_data, get_usda_weather_data_batch
 from dotenv import load_dotenv
 import os
 import pandas as pd
 import logging
+import calendar
+from datetime import date
+from itertools import groupby
+from concurrent.futures import ThreadPoolExecutor
+from utils.journal import IngestionJournal
+from utils.storage import save_dataframe, read_dataframe
+from utils.keys import register_station_keys
 
 load_dotenv()
 
@@ -11,43 +18,222 @@ source_data_directory = os.environ.get("SOURCE_DATA_DIRECTORY")
 def get_scan_stations_data():
     stations_data = get_usda_stations(networks="SNTL")
     scan_stations_df = filter_scan_data(stations_data)
+    # Llave entera de cada estación, estable entre ejecuciones
+    scan_stations_df = register_station_keys(scan_stations_df)
     return scan_stations_df
 
 def save_scan_stations_data(scan_stations_df):
-    scan_stations_df.to_csv(f"{source_data_directory}/scan_stations.csv")
+    save_dataframe(scan_stations_df, "scan_stations")
 
 def read_stations_data():
-    stations_df = pd.read_csv(f"{source_data_directory}/stations.csv")
+    stations_df = read_dataframe("stations")
     return stations_df
 
-def get_station_data(stations_df, duration, elements="TMAX,TMIN,PREC"):
-    results = []
+def _station_record(station, weather):
+    """
+    Construye el registro de una estación a partir de su respuesta de AWDB.
+    Devuelve una tupla (registro, error); solo uno de los dos es distinto de None.
+    """
+    if not weather:
+        return None, "respuesta vacía o error"
 
-    for station in stations_df.itertuples(index=False):
-        logging.info("Consultando estación %s", station.stationTriplet)
-        weather = get_usda_weather_data(
-            station.stationTriplet, elements, station.beginDate, duration
+    # Asegúrate de qué estructura recibes
+    if isinstance(weather, list):
+        first = weather[0] if weather else {}
+    else:
+        first = weather
+
+    if "data" not in first or not first["data"]:
+        return None, f"respuesta sin 'data': {str(first)[:200]}"
+
+    return {
+        "stationTriplet": station.stationTriplet,
+        "latitude": station.latitude,
+        "longitude": station.longitude,
+        "data": first["data"],
+    }, None
+
+def _fetch_station_batch(stations, duration, elements, end_date=None):
+    """
+    Consulta un grupo de estaciones y devuelve una tupla (registro, error) por estación,
+    en el mismo orden. Los grupos de una estación usan la consulta individual de siempre.
+    """
+    try:
+        if len(stations) == 1:
+            station = stations[0]
+            logging.info("Consultando estación %s", station.stationTriplet)
+            weather = get_usda_weather_data(
+                station.stationTriplet, elements, station.beginDate, duration, end_date
+            )
+            return [_station_record(station, weather)]
+
+        triplets = [station.stationTriplet for station in stations]
+        # Una sola fecha inicial para todo el grupo: la más antigua
+        begin_date = min(station.beginDate for station in stations)
+        logging.info("Consultando %d estaciones: %s", len(triplets), ",".join(triplets))
+        weather_by_station = get_usda_weather_data_batch(
+            triplets, elements, begin_date, duration, batch_size=len(triplets), end_date=end_date
         )
+    except Exception as e:
+        return [(None, f"excepción: {e}")] * len(stations)
 
-        if not weather:
-            logging.warning("Sin datos para %s (respuesta vacía o error).", station.stationTriplet)
-            continue
+    return [_station_record(station, weather_by_station.get(station.stationTriplet)) for station in stations]
+
+def get_station_data(stations_df, duration, elements="TMAX,TMIN,PREC", max_workers=1, batch_size=1, return_failures=False, journal_path=None,
+                     end_date=None, batch_by_begin_date=False):
+    """
+    Obtiene los datos históricos de cada estación de `stations_df`.
+
+    Parameters
+    ----------
+    stations_df : pd.DataFrame
+        Estaciones con columnas 'stationTriplet', 'latitude', 'longitude' y 'beginDate'.
+    duration : str
+        Duración de los datos en AWDB (p. ej. "MONTHLY").
+    elements : str
+        Elementos separados por comas.
+    max_workers : int
+        Número máximo de consultas simultáneas. Con 1 las estaciones se consultan
+        una a una, como antes.
+    batch_size : int
+        Estaciones por llamada a AWDB (ver `get_usda_weather_data_batch`).
+    return_failures : bool
+        Si es True devuelve también la lista de estaciones que fallaron.
+    journal_path : str | None
+        Diario de ingesta (`utils.journal`). Cada estación terminada se escribe al
+        momento; al reiniciar, las estaciones del diario no se vuelven a consultar.
+    end_date : str | None
+        Fecha final de la consulta ("YYYY-MM-DD"). Con None AWDB devuelve hasta hoy.
+    batch_by_begin_date : bool
+        Si es True cada lote solo reúne estaciones con el mismo 'beginDate'; si no,
+        el lote usa la fecha más antigua de sus estaciones.
+
+    Returns
+    -------
+    list[dict] | tuple[list[dict], list[dict]]
+        Un registro por estación con datos, en el mismo orden de `stations_df`.
+        Con `return_failures` se añade una lista de {"stationTriplet", "error"}.
+    """
+    stations = list(stations_df.itertuples(index=False))
+
+    journal = IngestionJournal(journal_path) if journal_path else None
+    completed = journal.completed() if journal else {}
+    pending = [station for station in stations if station.stationTriplet not in completed]
+    if completed:
+        logging.info("Reanudando: %d estaciones en el diario, %d pendientes", len(stations) - len(pending), len(pending))
+    if batch_by_begin_date:
+        pending = sorted(pending, key=lambda station: station.beginDate)
+        groups = [list(group) for _, group in groupby(pending, key=lambda station: station.beginDate)]
+    else:
+        groups = [pending]
+    batches = [group[i:i + batch_size] for group in groups for i in range(0, len(group), batch_size)]
+
+    def fetch(batch):
+        batch_outcomes = _fetch_station_batch(batch, duration, elements, end_date)
+        if journal:
+            for station, (record, _) in zip(batch, batch_outcomes):
+                if record is not None:
+                    journal.append(station.stationTriplet, record)
+        return batch_outcomes
 
-        # Asegúrate de qué estructura recibes
-        if isinstance(weather, list):
-            first = weather[0] if weather else {}
-        else:
-            first = weather
+    if max_workers > 1:
+        # executor.map conserva el orden de entrada
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            outcomes = [outcome for batch_outcomes in executor.map(fetch, batches) for outcome in batch_outcomes]
+    else:
+        outcomes = [outcome for batch in batches for outcome in fetch(batch)]
+    outcomes_by_station = {station.stationTriplet: outcome for station, outcome in zip(pending, outcomes)}
 
-        if "data" not in first or not first["data"]:
-            logging.warning("Respuesta sin 'data' para %s: %s", station.stationTriplet, first)
+    results = []
+    failures = []
+    for station in stations:
+        if station.stationTriplet in completed:
+            results.append(completed[station.stationTriplet])
+            continue
+        record, error = outcomes_by_station[station.stationTriplet]
+        if record is None:
+            logging.warning("Sin datos para %s (%s).", station.stationTriplet, error)
+            failures.append({"stationTriplet": station.stationTriplet, "error": error})
             continue
+        results.append(record)
+
+    if failures:
+        logging.warning(
+            "%d de %d estaciones sin datos: %s",
+            len(failures), len(stations), [f["stationTriplet"] for f in failures]
+        )
+
+    if return_failures:
+        return results, failures
+    return results
+
+def get_last_stored_periods(historical_df):
+    """
+    Devuelve un diccionario stationTriplet -> (year, month) con el último mes
+    guardado de cada estación en `historical_df`.
+    """
+    if historical_df is None or historical_df.empty:
+        return {}
+    last = (
+        historical_df.sort_values(["year", "month"])
+        .groupby("stationTriplet")[["year", "month"]]
+        .last()
+    )
+    return {triplet: (int(row.year), int(row.month)) for triplet, row in last.iterrows()}
 
-        results.append({
-            "stationTriplet": station.stationTriplet,
-            "latitude": station.latitude,
-            "longitude": station.longitude,
-            "data": first["data"],
-        })
+def last_complete_month(today=None):
+    """(year, month) del último mes terminado: el anterior al de `today`."""
+    today = today or date.today()
+    return (today.year, today.month - 1) if today.month > 1 else (today.year - 1, 12)
+
+def month_end(year, month):
+    """Último día del mes como "YYYY-MM-DD" (formato de endDate en AWDB)."""
+    return f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}"
+
+def get_incremental_stations(stations_df, last_periods, today=None):
+    """
+    Estaciones que necesitan datos nuevos, con `beginDate` en su último mes
+    guardado. Ese mes se vuelve a pedir por si quedó incompleto;
+    `upsert_historical_monthly_climate_data` lo reemplaza con la versión nueva.
+
+    Las estaciones sin historial conservan su `beginDate`. Las que ya tienen
+    guardado el último mes terminado (`last_complete_month`) se descartan: no
+    hay ningún mes completo que pedir para ellas.
+    """
+    last_complete = last_complete_month(today)
+    stations_df = stations_df.copy()
+    begin_dates = []
+    keep = []
+    for station in stations_df.itertuples(index=False):
+        last = last_periods.get(station.stationTriplet)
+        if last is None:
+            begin_dates.append(station.beginDate)
+            keep.append(True)
+            continue
+        year, month = last
+        begin_dates.append(f"{year}-{month:02d}-01")
+        keep.append((year, month) < last_complete)
+    stations_df["beginDate"] = begin_dates
+    return stations_df[keep].reset_index(drop=True)
 
-    return results
\ No newline at end of file
+def get_station_data_incremental(stations_df, duration, historical_df, elements="TMAX,TMIN,PREC", today=None, **kwargs):
+    """
+    Igual que `get_station_data` pero solo consulta, para cada estación, desde su
+    último (year, month) en `historical_df` (incluido) hasta el último mes
+    terminado. Cada lote reúne estaciones con la misma fecha inicial, para que
+    una estación atrasada no haga descargar de nuevo a las demás. Los argumentos
+    adicionales (max_workers, batch_size, ...) se pasan a `get_station_data`.
+    """
+    last_periods = get_last_stored_periods(historical_df)
+    stations_to_refresh = get_incremental_stations(stations_df, last_periods, today)
+    logging.info(
+        "Actualización incremental: %d de %d estaciones a actualizar",
+        len(stations_to_refresh), len(stations_df)
+    )
+    if stations_to_refresh.empty:
+        # Todas al día: no se hace ninguna consulta
+        return ([], []) if kwargs.get("return_failures") else []
+    return get_station_data(
+        stations_to_refresh, duration, elements,
+        end_date=month_end(*last_complete_month(today)), batch_by_begin_date=True, **kwargs
+    )
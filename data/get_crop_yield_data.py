@@ -1,8 +1,13 @@
 import os
+import json
 import pandas as pd
+from datetime import date
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 from utils.states_codes import states_dict
-from data.get_usda_data import get_usda_quick_stats
+from data.get_usda_data import get_usda_quick_stats, get_usda_quick_stats_count
+from utils.storage import save_dataframe, read_dataframe
+from utils.keys import add_county_fips
 
 
 load_dotenv()
@@ -16,28 +21,128 @@ states_with_data = []
 states_without_data = []
 
 
-file_path = f'{source_data_directory}/crop_yield.csv'
+dataset_name = 'crop_yield'
+# Estados sin datos por cultivo, para no volver a consultarlos
+manifest_path = f'{source_data_directory}/quick_stats_manifest.json'
 
-def get_crop_yield():
-    crop_yield_data = []
-    for state_code, state_name in states_dict.items():
-        print(f"Llamando API para: {state_name} ({state_code})")
-        response = get_usda_quick_stats(api_key=usda_api_key, state_alpha=state_code)
-        if response and "data" in response and response["data"]:  # Verifica que "data" no esté vacío
-            df = pd.DataFrame(response["data"])  # Convertir en DataFrame
-            crop_yield_data.append(df)
-            states_with_data.append(state_code)  # Agregar a la lista de estados con datos
-        else:
-            states_without_data.append(state_code)  # Agregar a la lista de estados sin datos
+# Quick Stats rechaza las consultas de más de 50.000 filas
+quick_stats_row_limit = 50000
+
+# Columnas numéricas de Quick Stats (llegan como texto, p. ej. "1,234" o "(D)")
+numeric_columns = ["Value", "CV (%)"]
+integer_columns = {"year": "int16"}
+code_columns = {"state_fips_code": 2, "county_code": 3, "asd_code": 2}
+
+def read_quick_stats_manifest():
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_quick_stats_manifest(manifest):
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+def get_state_crop_yield_records(state_code, commodity_desc="CORN", year_ge=2000, year_le=None):
+    """
+    Devuelve las filas de Quick Stats de un estado y cultivo. Si la consulta supera
+    el límite de filas de la API, el rango de años se divide en dos hasta que
+    cada parte cabe en una respuesta.
+
+    Devuelve [] si la API confirma que no hay datos (conteo 0) y None si no se
+    pudo saber (error de red o de la API).
+    """
+    count = get_usda_quick_stats_count(api_key=usda_api_key, commodity_desc=commodity_desc,
+                                       state_alpha=state_code, year_ge=year_ge, year_le=year_le)
+    if count == 0:
+        return []
+
+    if count is not None and count > quick_stats_row_limit:
+        last_year = year_le if year_le is not None else date.today().year
+        if last_year > year_ge:
+            middle = (year_ge + last_year) // 2
+            print(f"{state_code} {commodity_desc}: {count} filas, dividiendo {year_ge}-{last_year}")
+            first = get_state_crop_yield_records(state_code, commodity_desc, year_ge, middle)
+            second = get_state_crop_yield_records(state_code, commodity_desc, middle + 1, last_year)
+            if first is None and second is None:
+                return None
+            return (first or []) + (second or [])
+
+    response = get_usda_quick_stats(api_key=usda_api_key, commodity_desc=commodity_desc,
+                                    state_alpha=state_code, year_ge=year_ge, year_le=year_le)
+    if response and "data" in response and response["data"]:  # Verifica que "data" no esté vacío
+        return response["data"]
+    return None
+
+def to_typed_crop_yield_dataframe(records):
+    """Construye un único DataFrame con los tipos correctos a partir de las filas de Quick Stats."""
+    crop_yield_df = pd.DataFrame.from_records(records)
+    for col in numeric_columns:
+        if col in crop_yield_df.columns:
+            crop_yield_df[col] = pd.to_numeric(crop_yield_df[col].astype(str).str.replace(",", "").str.strip(), errors="coerce")
+    for col, dtype in integer_columns.items():
+        if col in crop_yield_df.columns:
+            crop_yield_df[col] = pd.to_numeric(crop_yield_df[col], errors="coerce").astype(dtype)
+    for col, width in code_columns.items():
+        if col in crop_yield_df.columns:
+            crop_yield_df[col] = crop_yield_df[col].astype(str).str.zfill(width)
+    if {"state_fips_code", "county_code"}.issubset(crop_yield_df.columns):
+        crop_yield_df = add_county_fips(crop_yield_df)
+    return crop_yield_df
+
+def get_crop_yield(commodities=("CORN",), max_workers=8, year_ge=2000, use_manifest=True):
+    """
+    Obtiene el rendimiento por condado de cada cultivo en `commodities` para todos
+    los estados de `states_dict`, consultando los estados en paralelo.
+
+    Los estados que ya se sabe que no tienen datos para un cultivo (manifiesto en
+    `manifest_path`) se omiten si `use_manifest` es True.
+    """
+    manifest = read_quick_stats_manifest() if use_manifest else {}
+    tasks = [
+        (commodity, state_code)
+        for commodity in commodities
+        for state_code in states_dict
+        if state_code not in manifest.get(commodity, [])
+    ]
+    skipped = len(commodities) * len(states_dict) - len(tasks)
+    if skipped:
+        print(f"Omitiendo {skipped} consultas de estados sin datos según el manifiesto")
+
+    def fetch(task):
+        commodity, state_code = task
+        print(f"Llamando API para: {states_dict[state_code]} ({state_code}) - {commodity}")
+        return get_state_crop_yield_records(state_code, commodity, year_ge=year_ge)
+
+    records = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for (commodity, state_code), state_records in zip(tasks, executor.map(fetch, tasks)):
+            if state_records:
+                records.extend(state_records)
+                if state_code not in states_with_data:
+                    states_with_data.append(state_code)  # Agregar a la lista de estados con datos
+            else:
+                if state_records is None:
+                    # Error o respuesta vacía sin conteo: no se guarda en el manifiesto
+                    if state_code not in states_without_data:
+                        states_without_data.append(state_code)
+                    continue
+                manifest.setdefault(commodity, [])
+                if state_code not in manifest[commodity]:
+                    manifest[commodity].append(state_code)
+                if state_code not in states_without_data:
+                    states_without_data.append(state_code)  # Agregar a la lista de estados sin datos
     print("Datos recopilados exitosamente.")
-    crop_yield_df = pd.concat(crop_yield_data, ignore_index=True)
+    if use_manifest:
+        save_quick_stats_manifest(manifest)
+    crop_yield_df = to_typed_crop_yield_dataframe(records)
     print("\nEstados con datos disponibles:", states_with_data)
     print("\nEstados sin datos disponibles:", states_without_data)
     return crop_yield_df
 
 def save_crop_yield_data(df_crop_yield):
-    df_crop_yield.to_csv(file_path)
+    save_dataframe(df_crop_yield, dataset_name)
 
 def read_crop_yied_data():
-    df_crop_yield = pd.read_csv(file_path)
+    df_crop_yield = read_dataframe(dataset_name)
     return df_crop_yield
@@ -1,10 +1,15 @@
 import os
-import time
-import requests
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from utils import http_client
+from utils.storage import save_dataframe
+
+load_dotenv()
 
 nasa_url = os.environ.get('NASA_API_URL')
+nasa_default_url = "https://power.larc.nasa.gov/api/temporal/monthly/point?"
 source_data_directory = os.environ.get("SOURCE_DATA_DIRECTORY")
 nasa_url_parameters = "parameters=T2M_MAX,T2M_MIN,T2M,PRECTOTCORR&community=ag&"
 months = [f"{m:02d}" for m in range(4, 11)]
@@ -17,26 +22,47 @@ api_to_df_cols = {
     'WS10M'        : 'WS10M',
     'RH2M'         : 'RH2M'          # ← faltaba
 }
-def get_nasa_data(lat: float, lon: float, year: int, months_needed: list[int]) -> list[dict]:
+
+# NASA POWER sirve las variables meteorológicas sobre la malla MERRA-2
+# de 0.5° (latitud) x 0.625° (longitud): cualquier punto de una celda
+# devuelve exactamente los mismos valores.
+power_grid_resolution = (0.5, 0.625)
+
+def snap_to_power_grid(lat, lon):
+    """Devuelve el centro de la celda de NASA POWER que contiene (lat, lon). Acepta escalares o arreglos."""
+    lat_res, lon_res = power_grid_resolution
+    grid_lat = np.round(np.round((np.asarray(lat) + 90) / lat_res) * lat_res - 90, 4)
+    grid_lon = np.round(np.round((np.asarray(lon) + 180) / lon_res) * lon_res - 180, 4)
+    return grid_lat, grid_lon
+def get_nasa_data_range(lat: float, lon: float, periods: list[tuple[int, int]]) -> list[dict]:
+    """
+    Consulta NASA POWER una sola vez para todos los `periods` (year, month) de
+    una ubicación: se pide el rango de años completo y la respuesta se separa
+    en una fila por mes solicitado.
+    """
+    if not periods:
+        return []
+    start = min(year for year, _ in periods)
+    end = max(year for year, _ in periods)
+    # Se lee en cada llamada para poder apuntar a un servidor local (utils.replay_server)
+    base_url = os.environ.get("NASA_API_URL") or nasa_default_url
     url = (
-        "https://power.larc.nasa.gov/api/temporal/monthly/point?"
+        f"{base_url.rstrip('?&')}?"
         f"parameters={','.join(api_to_df_cols.keys())}&"
         "community=ag&"
         f"longitude={lon}&latitude={lat}&"
-        f"start={year}&end={year}&format=JSON"
+        f"start={start}&end={end}&format=JSON"
     )
     print(f"Consultando URL: {url}")
 
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        data = response.json()["properties"]["parameter"]
+        data = http_client.get_json("nasa_power", url, timeout=30)["properties"]["parameter"]
     except Exception as e:
         print(f"Error consultando la NASA: {e}")
         return []
 
     result = []
-    for month in months_needed:
+    for year, month in periods:
         key = f"{year}{month:02d}"
         row = {
             "latitude":  lat,
@@ -50,8 +76,12 @@ def get_nasa_data(lat: float, lon: float, year: int, months_needed: list[int]) -
         result.append(row)
 
     return result
+
+def get_nasa_data(lat: float, lon: float, year: int, months_needed: list[int]) -> list[dict]:
+    return get_nasa_data_range(lat, lon, [(year, month) for month in months_needed])
+
 # Función principal para rellenar los valores faltantes
-def get_climate_missing_values(df):
+def get_climate_missing_values(df, max_workers=4):
     climate_cols = list(api_to_df_cols.values())  # ['TMAX', 'TMIN', 'TAVG', 'PRCP', 'WS10M', 'RH2M']
 
     # Asegurar que todas las columnas estén presentes en el DataFrame original
@@ -62,25 +92,41 @@ def get_climate_missing_values(df):
     # Filas con valores faltantes
     missing_mask = df[climate_cols].isnull().any(axis=1)
     locations = df[missing_mask][['latitude', 'longitude', 'year', 'month']].drop_duplicates()
-    locations.to_csv(f'{source_data_directory}/locations.csv')
+    save_dataframe(locations, 'locations')
+    locations = locations.copy()
     print(f"Total de ubicaciones únicas con faltantes: {len(locations)}")
 
-    climate_data = []
+    # Ubicaciones en la misma celda de la malla comparten consulta
+    locations['grid_lat'], locations['grid_lon'] = snap_to_power_grid(locations['latitude'], locations['longitude'])
+    cell_periods = locations[['grid_lat', 'grid_lon', 'year', 'month']].drop_duplicates()
 
-    grouped = locations.groupby(['latitude', 'longitude', 'year'])
-    for (lat, lon, year), group in grouped:
-        months_needed = group['month'].tolist()
-        print(f"→ Consultando ({lat}, {lon}) en {year} para meses: {months_needed}")
-        result = get_nasa_data(lat, lon, year, months_needed)
+    # Una sola consulta por celda con todos sus años faltantes
+    requests_by_cell = [
+        (float(lat), float(lon), list(zip(group['year'].astype(int), group['month'].astype(int))))
+        for (lat, lon), group in cell_periods.groupby(['grid_lat', 'grid_lon'])
+    ]
+    n_locations = len(locations[['latitude', 'longitude']].drop_duplicates())
+    print(f"Consultas a NASA POWER: {len(requests_by_cell)} celdas para {n_locations} ubicaciones")
 
-        if result:
-            climate_data.extend(result)
+    def fetch(request):
+        lat, lon, periods = request
+        print(f"→ Consultando celda ({lat}, {lon}) para {len(periods)} meses")
+        return get_nasa_data_range(lat, lon, periods)
+
+    climate_data = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for result in executor.map(fetch, requests_by_cell):
+            if result:
+                climate_data.extend(result)
 
     if not climate_data:
         print("⚠️ No se recuperaron datos climáticos.")
         return df
 
-    df_nasa = pd.DataFrame(climate_data)
+    # Repartir los valores de cada celda a todas las ubicaciones que contiene
+    df_cells = pd.DataFrame(climate_data).rename(columns={'latitude': 'grid_lat', 'longitude': 'grid_lon'})
+    df_nasa = locations.merge(df_cells, on=['grid_lat', 'grid_lon', 'year', 'month'], how='inner')
+    df_nasa = df_nasa.drop(columns=['grid_lat', 'grid_lon'])
     df_merged = df.merge(df_nasa, on=['latitude', 'longitude', 'year', 'month'], how='left', suffixes=('', '_nasa'))
 
     for col in climate_cols:
@@ -90,6 +136,6 @@ def get_climate_missing_values(df):
     print("✅ Valores climáticos completados exitosamente.")
     return df_merged
 
-def save_climate_missing_values(climate_missing_values, file_name = 'historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa.csv'):
-    climate_missing_values.to_csv(f'{source_data_directory}/{file_name}', index=False)
-    print("✅ Datos climáticos guardados en historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa.csv'")
\ No newline at end of file
+def save_climate_missing_values(climate_missing_values, name = 'historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa'):
+    path = save_dataframe(climate_missing_values, name)
+    print(f"✅ Datos climáticos guardados en {path}")
\ No newline at end of file
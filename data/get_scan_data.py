@@ -3,7 +3,7 @@ import pandas as pd
 from dotenv import load_dotenv
 import os
 import logging
-import json 
+from utils import http_client
 
 logging.basicConfig(level=logging.INFO)
 
@@ -31,9 +31,7 @@ def get_usda_stations(networks=None, station_ids=None):
         params["stationIds"] = station_ids
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()  # Lanza un error si el request falla
-        stations_data = response.json()
+        stations_data = http_client.get_json("awdb", url, params=params, timeout=60)  # Lanza un error si el request falla
         stations_df = pd.DataFrame(stations_data)
         return stations_df
     except requests.exceptions.RequestException as e:
@@ -44,7 +42,7 @@ def filter_scan_data(stations_df):
     stations_df = stations_df[stations_df['networkCode'] == 'SCAN'] 
     return stations_df
 
-def get_usda_weather_data(station_triplets, elements, begin_date, duration):
+def get_usda_weather_data(station_triplets, elements, begin_date, duration, end_date=None):
     url = f"{os.environ['USDA_API_URL']}/data"
     params = {
         "stationTriplets": station_triplets,
@@ -52,14 +50,60 @@ def get_usda_weather_data(station_triplets, elements, begin_date, duration):
         "beginDate": begin_date,
         "duration": duration
     }
+    if end_date:
+        params["endDate"] = end_date
+    # Con None _get_usda_weather_data_group divide el grupo y vuelve a consultar
     try:
-        r = requests.get(url, params=params, timeout=15)
-        r.raise_for_status()
-        logging.debug("Respuesta cruda: %s", r.text[:300])   # primeras 300 caracteres
-        return r.json()
+        return http_client.get_json("awdb_data", url, params=params, timeout=15)
     except requests.exceptions.RequestException as e:
         logging.error("Error al llamar a la API (%s): %s", station_triplets, e)
         return None
-    except json.JSONDecodeError:
-        logging.error("La respuesta no es JSON válido (%s): %s", station_triplets, r.text[:200])
-        return None
\ No newline at end of file
+    except ValueError as e:
+        logging.error("La respuesta no es JSON válido (%s): %s", station_triplets, e)
+        return None
+
+def _split_weather_by_station(weather, station_triplets):
+    """Separa la respuesta combinada de AWDB en un registro por stationTriplet."""
+    items = weather if isinstance(weather, list) else [weather]
+    records = {}
+    for item in items:
+        triplet = item.get("stationTriplet") if isinstance(item, dict) else None
+        if triplet in station_triplets:
+            records[triplet] = item
+    return records
+
+def get_usda_weather_data_batch(station_triplets, elements, begin_date, duration, batch_size=10, end_date=None):
+    """
+    Consulta varias estaciones por llamada usando la lista `stationTriplets` de AWDB.
+
+    Parámetros:
+        station_triplets (list[str]): Estaciones a consultar.
+        elements (str): Elementos separados por comas.
+        begin_date (str): Fecha inicial común del grupo (la más antigua).
+        duration (str): Duración de los datos (p. ej. "MONTHLY").
+        batch_size (int): Estaciones por llamada. Si una llamada falla (respuesta
+            demasiado grande, timeout o error) el grupo se divide en dos y se
+            vuelve a consultar hasta llegar a una sola estación.
+        end_date (str, opcional): Fecha final (por defecto, hasta hoy).
+
+    Retorna:
+        dict: stationTriplet -> registro de AWDB con las llaves 'stationTriplet' y 'data'.
+              Las estaciones que no se pudieron obtener no aparecen.
+    """
+    records = {}
+    for start in range(0, len(station_triplets), batch_size):
+        group = list(station_triplets[start:start + batch_size])
+        records.update(_get_usda_weather_data_group(group, elements, begin_date, duration, end_date))
+    return records
+
+def _get_usda_weather_data_group(station_triplets, elements, begin_date, duration, end_date=None):
+    weather = get_usda_weather_data(",".join(station_triplets), elements, begin_date, duration, end_date)
+    if not weather:
+        if len(station_triplets) == 1:
+            return {}
+        middle = len(station_triplets) // 2
+        logging.info("Dividiendo grupo de %d estaciones tras un fallo", len(station_triplets))
+        left = _get_usda_weather_data_group(station_triplets[:middle], elements, begin_date, duration, end_date)
+        right = _get_usda_weather_data_group(station_triplets[middle:], elements, begin_date, duration, end_date)
+        return {**left, **right}
+    return _split_weather_by_station(weather, set(station_triplets))
@@ -6,10 +6,63 @@ import pandas as pd
 from typing import Iterable, Tuple, List
 from dotenv import load_dotenv
 from tqdm import tqdm
+from utils import http_client
+from utils.storage import save_dataframe
+from utils.http_cache import read_cached_response, is_offline
+from utils.rate_limiter import get_rate_limiter
+from utils.journal import IngestionJournal
 
 load_dotenv()
 
 source_data_directory = os.environ.get("SOURCE_DATA_DIRECTORY")
+# Carpeta con las capas GeoTIFF/VRT de SoilGrids descargadas localmente
+soil_raster_directory = os.environ.get("SOILGRID_RASTER_DIRECTORY", "soilgrids")
+
+def _parse_soil_layers(data, lat, lon, elements, depth_range):
+    """Extrae el percentil Q0.5 de cada elemento en `depth_range` de una respuesta de SoilGrids."""
+    layers = data.get("properties", {}).get("layers", [])
+
+    result = {"latitude": lat, "longitude": lon}
+
+    for element in elements:
+        layer = next((layer for layer in layers if layer["name"] == element), None)
+        if layer:
+            depths = layer.get("depths", [])
+            value_q05 = None
+
+            for d in depths:
+                top = d["range"]["top_depth"]
+                bottom = d["range"]["bottom_depth"]
+                if (top, bottom) == depth_range:
+                    value_q05 = d["values"].get("Q0.5")
+                    break
+
+            col_name = f"{element}"
+            result[col_name] = value_q05
+        else:
+            result[f"{element}"] = None
+
+    return pd.DataFrame([result])
+
+def _soil_request(lat, lon, elements, depth_range):
+    """Devuelve (url, params) de la consulta a SoilGrids."""
+    url = os.environ.get("SOILGRID_API_URL")
+
+    # Construimos el parámetro depth en el formato que espera la API, p. ej. "15-30cm"
+    depth_param = f"{depth_range[0]}-{depth_range[1]}cm"
+
+    params = {
+        "lat": lat,
+        "lon": lon,
+        "property": list(elements),
+        "depth": depth_param
+    }
+    return url, params
+
+def is_soil_data_cached(lat, lon, elements, depth_range=(15, 30)) -> bool:
+    """Indica si la consulta de SoilGrids ya está en la caché (no hace falta esperar)."""
+    url, params = _soil_request(lat, lon, elements, depth_range)
+    return read_cached_response("soilgrids", url, params) is not None
 
 def get_soil_data(
     lat: float,
@@ -42,77 +95,18 @@ def get_soil_data(
     if elements is None:
         elements = ["silt"]
 
-    url = os.environ.get("SOILGRID_API_URL")
-
-    # Construimos el parámetro depth en el formato que espera la API, p. ej. "15-30cm"
-    depth_param = f"{depth_range[0]}-{depth_range[1]}cm"
+    url, params = _soil_request(lat, lon, elements, depth_range)
 
-    params = {
-        "lat": lat,
-        "lon": lon,
-        "property": elements,
-        "depth": depth_param
-    }
-
-    delay = 2
-    for attempt in range(1, max_retries + 1):
-        try:
-            response = requests.get(url, params=params, timeout=10)
-
-            if response.status_code == 200:
-                data = response.json()
-                layers = data.get("properties", {}).get("layers", [])
-
-                result = {"latitude": lat, "longitude": lon}
-
-                for element in elements:
-                    layer = next((layer for layer in layers if layer["name"] == element), None)
-                    if layer:
-                        depths = layer.get("depths", [])
-                        value_q05 = None
-
-                        for d in depths:
-                            top = d["range"]["top_depth"]
-                            bottom = d["range"]["bottom_depth"]
-                            if (top, bottom) == depth_range:
-                                value_q05 = d["values"].get("Q0.5")
-                                break
-
-                        col_name = f"{element}"
-                        result[col_name] = value_q05
-                    else:
-                        result[f"{element}"] = None
-
-                return pd.DataFrame([result])
-
-            elif response.status_code == 429:
-                print(f"429 Too Many Requests en intento {attempt}/{max_retries} para {lat}, {lon}")
-                retry_after = response.headers.get("Retry-After")
-                if retry_after:
-                    try:
-                        delay = int(retry_after)
-                    except ValueError:
-                        pass
-                if attempt < max_retries:
-                    print(f"Esperando {delay} s antes de reintentar…")
-                    time.sleep(delay)
-                    delay *= 2
-                else:
-                    break  # se sale al final y devuelve NaN
-
-            else:
-                print(f"Error {response.status_code} - {response.text}")
-                if attempt < max_retries:
-                    time.sleep(2)
-                else:
-                    break
-
-        except requests.exceptions.RequestException as e:
-            print(f"Error de conexión en intento {attempt}/{max_retries}: {e}")
-            if attempt < max_retries:
-                time.sleep(2)
-            else:
-                break
+    # La caché, el limitador compartido de SoilGrids y los reintentos (429, 5xx,
+    # errores de conexión) los maneja el cliente HTTP común
+    try:
+        data = http_client.get_json(
+            "soilgrids", url, params=params, timeout=10,
+            max_retries=max(0, max_retries - 1), rate_limiter=get_rate_limiter("soilgrids")
+        )
+        return _parse_soil_layers(data, lat, lon, elements, depth_range)
+    except requests.exceptions.RequestException as e:
+        print(f"Error consultando SoilGrids para {lat}, {lon}: {e}")
 
     # Si llega aquí es que hubo error: devolvemos NaNs
     return pd.DataFrame([{
@@ -121,15 +115,97 @@ def get_soil_data(
         **{f"{e}": None for e in elements}
     }])
 
+def get_soil_raster_path(
+    element: str,
+    depth_range: Tuple[int, int] = (15, 30),
+    raster_directory: str | None = None,
+    quantile: str = "Q0.5"
+) -> str | None:
+    """
+    Busca la capa local de SoilGrids de un elemento, con el nombre que usa ISRIC
+    (p. ej. "phh2o_15-30cm_Q0.5.vrt"), en `raster_directory` o en su subcarpeta
+    `<element>/`. Se prefiere el VRT sobre el GeoTIFF.
+    """
+    raster_directory = raster_directory or soil_raster_directory
+    base_name = f"{element}_{depth_range[0]}-{depth_range[1]}cm_{quantile}"
+    for folder in (raster_directory, os.path.join(raster_directory, element)):
+        for extension in (".vrt", ".tif", ".tiff"):
+            path = os.path.join(folder, base_name + extension)
+            if os.path.exists(path):
+                return path
+    return None
+
+def get_soil_data_from_rasters(
+    coords: pd.DataFrame,
+    elements: Iterable[str] | None = None,
+    depth_range: Tuple[int, int] = (15, 30),
+    raster_directory: str | None = None
+) -> pd.DataFrame:
+    """
+    Obtiene el percentil Q0.5 de cada elemento para todos los puntos de `coords`
+    muestreando las capas locales de SoilGrids, sin llamar a la API.
+
+    Parameters
+    ----------
+    coords : pd.DataFrame
+        DataFrame con columnas 'latitude' y 'longitude' (WGS84).
+    elements : Iterable[str] | None
+        Propiedades a muestrear.  Si es None se usa ["silt"].
+    depth_range : (int, int)
+        Profundidad (cm) superior e inferior.  Ej.: (15, 30).
+    raster_directory : str | None
+        Carpeta de las capas.  Por defecto SOILGRID_RASTER_DIRECTORY.
+
+    Returns
+    -------
+    pd.DataFrame
+        Una fila por punto con lat, lon y una columna por elemento, en las
+        mismas unidades enteras que devuelve la API (None fuera de cobertura).
+    """
+    import rasterio
+    from rasterio.warp import transform
+
+    if elements is None:
+        elements = ["silt"]
+
+    lats = coords["latitude"].to_numpy(dtype=float)
+    lons = coords["longitude"].to_numpy(dtype=float)
+    result = pd.DataFrame({"latitude": coords["latitude"].to_numpy(), "longitude": coords["longitude"].to_numpy()})
+
+    for element in elements:
+        path = get_soil_raster_path(element, depth_range, raster_directory)
+        if path is None or result.empty:
+            if path is None:
+                print(f"No se encontró la capa local de {element} ({depth_range[0]}-{depth_range[1]} cm)")
+            result[element] = pd.array([None] * len(result), dtype="Int64")
+            continue
+
+        with rasterio.open(path) as src:
+            # Las capas de SoilGrids están en Homolosine: se transforman todos los puntos de una vez
+            if src.crs is not None and src.crs.to_epsg() != 4326:
+                xs, ys = transform("EPSG:4326", src.crs, lons, lats)
+            else:
+                xs, ys = lons, lats
+            samples = np.ma.stack(list(src.sample(zip(xs, ys), indexes=1, masked=True)))[:, 0]
+
+        values = pd.array(np.ma.filled(samples.astype(float), np.nan), dtype="Float64").round().astype("Int64")
+        result[element] = values
+
+    return result
+
 def get_soil_scan_stations_dataframe(
     station_coords: pd.DataFrame, 
     elements: List[str] = ["phh2o", "ocd", "cec", "sand", "silt", "clay"],
-    sleep_time: int = 12,
-    verbose: bool = True
+    sleep_time: int | None = None,
+    verbose: bool = True,
+    backend: str = "api",
+    raster_directory: str | None = None,
+    journal_path: str | None = None
 ) -> pd.DataFrame:
     """
-    Obtiene los datos de SoilGrids para cada estación en `station_coords`,
-    respetando el límite de 6 llamadas por minuto (1 cada 10 segundos).
+    Obtiene los datos de SoilGrids para cada estación en `station_coords`.
+    El ritmo de llamadas lo controla el limitador compartido de SoilGrids
+    (`utils.rate_limiter`), que se ajusta a los 429 observados.
     
     Parameters
     ----------
@@ -137,18 +213,36 @@ def get_soil_scan_stations_dataframe(
         DataFrame con columnas 'latitude', 'longitude' y 'stationTriplet'.
     elements : List[str]
         Lista de propiedades edáficas a consultar.
-    sleep_time : int
-        Tiempo de espera entre llamadas (por defecto 10 segundos).
+    sleep_time : int | None
+        Espera fija adicional entre llamadas. Por defecto None: solo se usa el limitador.
     verbose : bool
         Muestra progreso si True.
+    backend : str
+        "api" consulta SoilGrids estación por estación; "raster" muestrea todas las
+        estaciones a la vez desde las capas locales (ver `get_soil_data_from_rasters`).
+    raster_directory : str | None
+        Carpeta de las capas locales para el backend "raster".
+    journal_path : str | None
+        Diario de ingesta (`utils.journal`) del backend "api": cada estación se
+        escribe al terminarla y al reiniciar solo se consultan las pendientes.
     
     Returns
     -------
     pd.DataFrame
         Datos de suelo por estación.
     """
+    if backend == "raster":
+        soil_df = get_soil_data_from_rasters(station_coords, elements, depth_range=(15, 30), raster_directory=raster_directory)
+        soil_df['stationTriplet'] = station_coords['stationTriplet'].to_numpy()
+        return soil_df
+    if backend != "api":
+        raise ValueError(f"Backend de suelo no soportado: {backend}")
+
     soils_list = []
 
+    journal = IngestionJournal(journal_path) if journal_path else None
+    completed = journal.completed() if journal else {}
+
     iterator = tqdm(station_coords.iterrows(), total=len(station_coords)) if verbose else station_coords.iterrows()
 
     for idx, station_coord in iterator:
@@ -156,18 +250,28 @@ def get_soil_scan_stations_dataframe(
         longitude = station_coord['longitude']
         triplet = station_coord['stationTriplet']
 
+        if triplet in completed:
+            soils_list.append(pd.DataFrame([completed[triplet]]))
+            continue
+
+        cached = is_soil_data_cached(latitude, longitude, elements, depth_range=(15, 30))
         try:
             soil_df = get_soil_data(latitude, longitude, elements, depth_range=(15, 30), max_retries=5)
             soil_df['stationTriplet'] = triplet
 
             if soil_df is not None and not soil_df.empty:
                 soils_list.append(soil_df)
+                # Las filas vacías (error de la API) no se anotan para reintentarlas al reiniciar
+                if journal and soil_df[list(elements)].notna().any(axis=1).iloc[0]:
+                    journal.append(triplet, soil_df.iloc[0].to_dict())
 
         except Exception as e:
             print(f"Error en estación {triplet} ({latitude}, {longitude}): {e}")
             continue
 
-        time.sleep(sleep_time)
+        # Las respuestas en caché no consumen cuota de la API
+        if sleep_time and not cached and not is_offline():
+            time.sleep(sleep_time)
 
     if soils_list:
         return pd.concat(soils_list, ignore_index=True)
@@ -175,5 +279,4 @@ def get_soil_scan_stations_dataframe(
         return pd.DataFrame()  # Vacío si todas fallan
 
 def save_soil_scan_stations_dataframe(soil_data_by_scan_stations):
-    os.makedirs('source_data', exist_ok=True)
-    soil_data_by_scan_stations.to_csv(f'{source_data_directory}/historical_soil_data_by_scan_stations.csv', index=False)
\ No newline at end of file
+    save_dataframe(soil_data_by_scan_stations, 'historical_soil_data_by_scan_stations')
\ No newline at end of file
@@ -2,12 +2,31 @@ import requests
 import pandas as pd
 import os
 from dotenv import load_dotenv
+from utils import http_client
 
 load_dotenv()
 
+def _quick_stats_params(api_key, source_desc, sector_desc, group_desc, commodity_desc, statisticcat_desc,
+                        year_ge, agg_level_desc, unit_desc, state_alpha, year_le=None):
+    params = {
+        "key": api_key,
+        "source_desc": source_desc,
+        "sector_desc": sector_desc,
+        "group_desc": group_desc,
+        "commodity_desc": commodity_desc,
+        "statisticcat_desc": statisticcat_desc,
+        "year__GE": year_ge,
+        "agg_level_desc": agg_level_desc,
+        "unit_desc": unit_desc,
+        "state_alpha": state_alpha
+    }
+    if year_le is not None:
+        params["year__LE"] = year_le
+    return params
+
 def get_usda_quick_stats(api_key, source_desc="SURVEY", sector_desc="CROPS", group_desc="FIELD CROPS",
                          commodity_desc="CORN", statisticcat_desc="YIELD", year_ge=2000,
-                         agg_level_desc="COUNTY", unit_desc="BU / ACRE", state_alpha="IA"):
+                         agg_level_desc="COUNTY", unit_desc="BU / ACRE", state_alpha="IA", year_le=None):
     """
     Llama a la API de Quick Stats del USDA para obtener datos agrícolas.
 
@@ -23,31 +42,36 @@ def get_usda_quick_stats(api_key, source_desc="SURVEY", sector_desc="CROPS", gro
         agg_level_desc (str, opcional): Nivel de agregación de los datos (por defecto "COUNTY").
         unit_desc (str, opcional): Unidad de medida (por defecto "BU / ACRE").
         state_alpha (str, opcional): Estado de EE.UU. en formato de dos letras (por defecto "IA").
+        year_le (int, opcional): Año máximo de los datos (por defecto sin límite).
 
     Retorna:
         dict: Respuesta en formato JSON con los datos agrícolas.
     """
     url = os.environ.get("USDA_QUICK_STATS_URL")
-    params = {
-        "key": api_key,
-        "source_desc": source_desc,
-        "sector_desc": sector_desc,
-        "group_desc": group_desc,
-        "commodity_desc": commodity_desc,
-        "statisticcat_desc": statisticcat_desc,
-        "year__GE": year_ge,
-        "agg_level_desc": agg_level_desc,
-        "unit_desc": unit_desc,
-        "state_alpha": state_alpha
-    }
+    params = _quick_stats_params(api_key, source_desc, sector_desc, group_desc, commodity_desc, statisticcat_desc,
+                                 year_ge, agg_level_desc, unit_desc, state_alpha, year_le)
 
     try:
-        response = requests.get(url, params=params)
-        print()
-        response.raise_for_status()  # Manejo de errores de solicitud
-        return response.json()
+        # La llave de la API no forma parte de la llave de la caché
+        return http_client.get_json("quick_stats", url, params=params, timeout=60)  # Manejo de errores de solicitud
     except requests.exceptions.RequestException as e:
         print(f"Error al llamar a la API: {e}")
         return None
-    
 
+def get_usda_quick_stats_count(api_key, source_desc="SURVEY", sector_desc="CROPS", group_desc="FIELD CROPS",
+                               commodity_desc="CORN", statisticcat_desc="YIELD", year_ge=2000,
+                               agg_level_desc="COUNTY", unit_desc="BU / ACRE", state_alpha="IA", year_le=None):
+    """
+    Devuelve el número de filas que devolvería `get_usda_quick_stats` con los mismos
+    parámetros (endpoint get_counts), o None si la consulta falla.
+    """
+    url = os.environ.get("USDA_QUICK_STATS_COUNTS_URL") or os.environ.get("USDA_QUICK_STATS_URL", "").replace("api_GET", "get_counts")
+    params = _quick_stats_params(api_key, source_desc, sector_desc, group_desc, commodity_desc, statisticcat_desc,
+                                 year_ge, agg_level_desc, unit_desc, state_alpha, year_le)
+
+    try:
+        response = http_client.get_json("quick_stats", url, params=params, timeout=60)
+        return int(response["count"])
+    except (requests.exceptions.RequestException, KeyError, TypeError, ValueError) as e:
+        print(f"Error al consultar el conteo de Quick Stats: {e}")
+        return None
@@ -0,0 +1,109 @@
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from dotenv import load_dotenv
+from utils.storage import save_dataframe
+from utils.keys import add_station_key
+
+load_dotenv()
+
+#################################################
+#####Interpolación IDW de estaciones a condados##
+#################################################
+# En lugar de heredar el clima y el suelo de una sola estación, cada condado
+# recibe el promedio ponderado por inverso de la distancia (IDW) de sus k
+# estaciones más cercanas (`get_county_station_neighbors` en data/get_centroids.py):
+#
+#   valor(condado, t) = Σ w_s · valor(s, t) / Σ w_s,   w_s = 1 / distancia_s ** power
+#
+# Los pesos forman una matriz dispersa W (condados x estaciones) y los datos de
+# las estaciones un arreglo denso (estaciones x (año, mes, variable)); todo el
+# cálculo son dos productos W @ X. Las estaciones sin dato en un mes no cuentan
+# en ese mes (sus pesos salen también del denominador).
+
+idw_neighbors = int(os.environ.get("IDW_NEIGHBORS", 4))
+idw_power = float(os.environ.get("IDW_POWER", 2))
+# Distancia mínima (km) para no dividir por cero si una estación está sobre el centroide
+idw_min_distance_km = 0.1
+
+idw_feature_columns = [
+    'TMAX', 'TMIN', 'TAVG', 'PRCP', 'SMS_-8', 'WS10M', 'RH2M',
+    'phh2o', 'ocd', 'cec', 'sand', 'silt', 'clay',
+]
+
+
+def idw_weight_matrix(neighbors, power=None):
+    """
+    Matriz dispersa de pesos IDW a partir de la tabla de vecinos.
+
+    Parámetros:
+        neighbors (pd.DataFrame): county_fips, station_key y distance_km (una fila por vecino).
+        power (float, opcional): Exponente de la distancia (por defecto IDW_POWER).
+
+    Retorna:
+        tuple: (W en formato CSR de condados x estaciones, índice de condados, índice de estaciones).
+    """
+    power = idw_power if power is None else power
+    counties = pd.Index(pd.unique(neighbors["county_fips"]), name="county_fips")
+    stations = pd.Index(pd.unique(neighbors["station_key"]), name="station_key")
+    distances = np.maximum(neighbors["distance_km"].to_numpy(dtype="float64"), idw_min_distance_km)
+    weights = sparse.csr_matrix(
+        (1 / distances ** power, (counties.get_indexer(neighbors["county_fips"]), stations.get_indexer(neighbors["station_key"]))),
+        shape=(len(counties), len(stations)),
+    )
+    return weights, counties, stations
+
+def station_time_array(station_data, stations, feature_columns):
+    """
+    Arreglo denso (estaciones, periodos, variables) con NaN donde no hay dato.
+    Los periodos son los pares (año, mes) presentes en `station_data`.
+    """
+    periods = (station_data["year"].to_numpy(dtype="int32") * 100 + station_data["month"].to_numpy(dtype="int32"))
+    period_index = pd.Index(np.unique(periods))
+    values = np.full((len(stations), len(period_index), len(feature_columns)), np.nan, dtype="float32")
+    station_pos = stations.get_indexer(station_data["station_key"])
+    period_pos = period_index.get_indexer(periods)
+    known = station_pos >= 0
+    values[station_pos[known], period_pos[known], :] = (
+        station_data[feature_columns].to_numpy(dtype="float32", na_value=np.nan)[known]
+    )
+    return values, period_index
+
+def interpolate_county_features(neighbors, station_data, feature_columns=None, power=None):
+    """
+    Variables de clima y suelo por (condado, año, mes) interpoladas con IDW.
+
+    Parámetros:
+        neighbors (pd.DataFrame): Tabla de `get_county_station_neighbors`.
+        station_data (pd.DataFrame): Datos mensuales por estación (stationTriplet o
+            station_key, year, month y las variables).
+        feature_columns (list[str], opcional): Variables a interpolar (por defecto
+            las de `idw_feature_columns` presentes en `station_data`).
+        power (float, opcional): Exponente de la distancia (por defecto IDW_POWER).
+
+    Retorna:
+        pd.DataFrame: county_fips, year, month y una columna por variable (float32).
+        Se omiten los periodos en que ningún vecino del condado tiene datos.
+    """
+    station_data = add_station_key(station_data)
+    feature_columns = feature_columns or [c for c in idw_feature_columns if c in station_data.columns]
+    weights, counties, stations = idw_weight_matrix(neighbors, power)
+    values, periods = station_time_array(station_data, stations, feature_columns)
+
+    flat = values.reshape(len(stations), -1)
+    available = ~np.isnan(flat)
+    numerator = weights @ np.where(available, flat, 0)
+    denominator = weights @ available.astype("float64")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        interpolated = (numerator / denominator).astype("float32")
+
+    n_periods = len(periods)
+    result = pd.DataFrame(interpolated.reshape(len(counties) * n_periods, len(feature_columns)), columns=feature_columns)
+    result.insert(0, "county_fips", np.repeat(counties.to_numpy(), n_periods))
+    result.insert(1, "year", np.tile(periods.to_numpy() // 100, len(counties)))
+    result.insert(2, "month", np.tile(periods.to_numpy() % 100, len(counties)))
+    return result.dropna(subset=feature_columns, how="all").reset_index(drop=True)
+
+def save_county_idw_features(county_features):
+    save_dataframe(county_features, "historical_monthly_climate_soil_data_apr_sept_by_county_idw")
@@ -1,36 +1,62 @@
 import pandas as pd
 import os
 from dotenv import load_dotenv
+from utils.storage import save_dataframe
+from utils.join_engine import merge
+from utils.keys import add_county_fips, add_station_key
 
 load_dotenv()
 
 source_data_directory = os.environ.get("SOURCE_DATA_DIRECTORY")
 columns = ['state_name', 'county_name', 'state_alpha', 'county_code', 'month', 'year', 'stationTriplet', 'stationId','name', 'lat_centroid', 'lon_centroid', 'latitude', 'longitude', 'TMAX', 'TMIN', 'phh2o', 'ocd', 'cec','sand', 'silt', 'clay', 'PRCP', 'SMS_-8', 'TAVG', 'WS10M', 'RH2M', 'Value', 'unit_desc']
 
+## Los joins se hacen sobre las llaves enteras station_key y county_fips (utils/keys.py).
+## Las columnas descriptivas repetidas (stationTriplet, latitude, ...) se toman de la tabla izquierda.
+## El dataset final (columns) no incluye las llaves para no agregarlas como variables de los modelos.
+def _drop_shared_columns(right, left, keys):
+    shared = [c for c in right.columns if c in left.columns and c not in keys]
+    return right.drop(columns=shared)
+
 ## Hacemos merge entre los dataframes de clima y suelo.
-def merge_monthly_scan_stations_with_soil(soil_data_by_station, monthly_climate_data_by_station):
-    monthly_climate_soil_data_by_station = soil_data_by_station.merge(monthly_climate_data_by_station, how = 'inner', on = ['stationTriplet', 'latitude', 'longitude'])
+## engine: "pandas" (en memoria) o "duckdb" (fuera de memoria, ver utils/join_engine.py); por defecto MERGE_ENGINE.
+def merge_monthly_scan_stations_with_soil(soil_data_by_station, monthly_climate_data_by_station, engine=None):
+    soil_data_by_station = add_station_key(soil_data_by_station)
+    monthly_climate_data_by_station = _drop_shared_columns(add_station_key(monthly_climate_data_by_station), soil_data_by_station, ['station_key'])
+    monthly_climate_soil_data_by_station = merge(soil_data_by_station, monthly_climate_data_by_station, how = 'inner', on = ['station_key'], engine=engine)
     return monthly_climate_soil_data_by_station
 
 def save_monthly_climate_soil_data_by_scan_station(monthly_climate_soil_data_by_station):
-    monthly_climate_soil_data_by_station.to_csv(f'{source_data_directory}/historical_monthly_climate_soil_data_apr_sept_by_scan_station.csv', index=False)
+    save_dataframe(monthly_climate_soil_data_by_station, 'historical_monthly_climate_soil_data_apr_sept_by_scan_station')
 
 def merge_counties_crop_yield_with_scan_stations(cornbelt_yield_county_centroids, counties_nearest_usda_station):
-    crop_yield_usda_stations = cornbelt_yield_county_centroids.merge(right=counties_nearest_usda_station, on=["lat_centroid", "lon_centroid"])
+    cornbelt_yield_county_centroids = add_county_fips(cornbelt_yield_county_centroids)
+    counties_nearest_usda_station = _drop_shared_columns(add_county_fips(counties_nearest_usda_station), cornbelt_yield_county_centroids, ['county_fips'])
+    crop_yield_usda_stations = cornbelt_yield_county_centroids.merge(right=counties_nearest_usda_station, on=["county_fips"])
     return crop_yield_usda_stations
 
 def save_crop_yield_scan_stations(crop_yield_scan_stations):
-    crop_yield_scan_stations.to_csv(f'{source_data_directory}/crop_yield_scan_stations.csv')
+    save_dataframe(crop_yield_scan_stations, 'crop_yield_scan_stations')
     return crop_yield_scan_stations
 
-def merge_counties_crop_yield_with_historical_scan_stations(crop_yield_scan_stations, monthly_climate_soil_data_by_station):
-    monthly_historical_climate_soil_crop_yield_data_by_scan_stations = crop_yield_scan_stations.merge(right=monthly_climate_soil_data_by_station, on=["year", "stationTriplet", "latitude", "longitude"])
-    monthly_historical_climate_soil_crop_yield_data_by_scan_stations = monthly_historical_climate_soil_crop_yield_data_by_scan_stations[columns]
+def merge_counties_crop_yield_with_historical_scan_stations(crop_yield_scan_stations, monthly_climate_soil_data_by_station, engine=None):
+    crop_yield_scan_stations = add_station_key(crop_yield_scan_stations)
+    monthly_climate_soil_data_by_station = _drop_shared_columns(add_station_key(monthly_climate_soil_data_by_station), crop_yield_scan_stations, ['year', 'station_key'])
+    # La selección de columnas se hace dentro del motor: con duckdb el resto nunca se materializa
+    monthly_historical_climate_soil_crop_yield_data_by_scan_stations = merge(crop_yield_scan_stations, monthly_climate_soil_data_by_station, on=["year", "station_key"], engine=engine, columns=columns)
     monthly_historical_climate_soil_crop_yield_data_by_scan_stations.rename(columns={"Value": "Yield"})
     return monthly_historical_climate_soil_crop_yield_data_by_scan_stations
 
+## Alternativa con variables interpoladas (IDW, data/interpolate_features.py): el cruce es por condado y año, sin estación.
+idw_columns = ['state_name', 'county_name', 'state_alpha', 'county_code', 'month', 'year', 'lat_centroid', 'lon_centroid', 'TMAX', 'TMIN', 'phh2o', 'ocd', 'cec','sand', 'silt', 'clay', 'PRCP', 'SMS_-8', 'TAVG', 'WS10M', 'RH2M', 'Value', 'unit_desc']
+
+def merge_counties_crop_yield_with_idw_features(cornbelt_yield_county_centroids, county_idw_features, engine=None):
+    cornbelt_yield_county_centroids = add_county_fips(cornbelt_yield_county_centroids)
+    county_idw_features = _drop_shared_columns(county_idw_features, cornbelt_yield_county_centroids, ['year', 'county_fips'])
+    selected = [c for c in idw_columns if c in cornbelt_yield_county_centroids.columns or c in county_idw_features.columns]
+    return merge(cornbelt_yield_county_centroids, county_idw_features, on=["year", "county_fips"], engine=engine, columns=selected)
+
 def save_counties_crop_yield_with_historical_scan_stations(monthly_historical_climate_soil_data_by_station):
-    monthly_historical_climate_soil_data_by_station.to_csv(f"{source_data_directory}/historical_monthly_climate_soil_crop_yield_data_by_scan_stations.csv")
+    save_dataframe(monthly_historical_climate_soil_data_by_station, "historical_monthly_climate_soil_crop_yield_data_by_scan_stations")
 
 def save_historical_monthly_climate_imputed_data_by_scan_stations(monthly_historical_climate_soil_data_by_station):
-    monthly_historical_climate_soil_data_by_station.to_csv(f"{source_data_directory}/historical_monthly_climate_by_scan_stations_sms8_imputed.csv")
+    save_dataframe(monthly_historical_climate_soil_data_by_station, "historical_monthly_climate_by_scan_stations_sms8_imputed")
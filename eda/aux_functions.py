@@ -40,7 +40,7 @@ def plot_yearly_crop_yield(df_grouped, results_directory = 'results'):
 def plot_crop_yield_by_status(df, results_directory = 'results'):
     # Visualizar rendimiento promedio por estado
     # Calcular el rendimiento promedio por estado
-    state_avg = df.groupby('state_name')['Value'].mean().sort_values(ascending=False).reset_index()
+    state_avg = df.groupby('state_name', observed=True)['Value'].mean().sort_values(ascending=False).reset_index()
     plt.figure(figsize=(12, 6))
     sns.barplot(data=state_avg, x='Value', y='state_name', palette='viridis')
     plt.title("Rendimiento promedio de maíz por estado (2000–2020)")
@@ -53,7 +53,7 @@ def plot_crop_yield_by_status(df, results_directory = 'results'):
 def plot_crop_yield_by_status_top_20(df, results_directory):
     # Visualizar los 20 condados con mayor rendimiento promedio
     # Para condados, seleccionamos los 20 con mayor promedio
-    county_avg = df.groupby(['state_name', 'county_name'])['Value'].mean().sort_values(ascending=False).head(20).reset_index()
+    county_avg = df.groupby(['state_name', 'county_name'], observed=True)['Value'].mean().sort_values(ascending=False).head(20).reset_index()
     plt.figure(figsize=(12, 6))
     sns.barplot(data=county_avg, x='Value', y='county_name', hue='state_name', dodge=False)
     plt.title("Top 20 condados con mayor rendimiento promedio de maíz")
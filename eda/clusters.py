@@ -8,8 +8,9 @@ import geopandas as gpd
 import pandas as pd
 import matplotlib.pyplot as plt
 from utils.states_codes import state_alpha_to_fips 
+from utils.storage import load_modeling_dataset
 # Cargar datos
-df = pd.read_csv("source_data/historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa_final.csv")
+df = load_modeling_dataset(directory="source_data")
 
 # Vista general del DataFrame
 print(df.head())
@@ -18,7 +19,7 @@ print(df.columns)
 # Eliminar columnas no deseadas
 columns_to_drop = ['Unnamed: 0', 'stationId', 'lat_centroid', 'lon_centroid', 'latitude',
                     'longitude','state_name','county_name', 'state_alpha', 'county_code', 'month', 'year', 'unit_desc']  # ajusta según lo que veas en tu archivo
-df_cluster = df.drop(columns=columns_to_drop)
+df_cluster = df.drop(columns=columns_to_drop, errors='ignore')
 
 # Eliminar columnas no numéricas si quedan
 df_cluster = df_cluster.select_dtypes(include=['number'])
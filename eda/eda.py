@@ -1,6 +1,7 @@
 import os
 import pandas as pd
 from dotenv import load_dotenv
+from utils.storage import load_modeling_dataset
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
@@ -15,9 +16,8 @@ load_dotenv()
 #################################################################
 
 source_data_directory = os.environ.get("SOURCE_DATA_DIRECTORY")
-file_path = f'{source_data_directory}/historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa_final.csv'
 
-df = pd.read_csv(file_path)
+df = load_modeling_dataset()
 report_directory = 'reports'
 
 #################Columnas a eliminar#############################
@@ -29,7 +29,7 @@ columns_to_drop = ['Unnamed: 0', 'state_alpha', 'county_code', 'stationTriplet',
 results_directory = 'results'
 
 #Eliminacion de columnas
-df = df.drop(columns=columns_to_drop)
+df = df.drop(columns=columns_to_drop, errors='ignore')
 print(df.columns)
 
 ###############Creacion de directorio para almacenar reportes############################
@@ -1,4 +1,7 @@
+import os
+import hashlib
 import geopandas as gpd
+import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 
@@ -7,21 +10,126 @@ import numpy as np
 
 from shapely.geometry import Point, Polygon
 from scipy.spatial import Voronoi
+from utils.geometry_store import load_layer, geometry_store_directory
+
+#################################################
+#####Estados, estaciones y Voronoi en caché######
+#################################################
+# Los estados se leen una vez del almacén de geometrías (utils/geometry_store.py):
+# "states" (1:20m) para el mapa de estados y "states_500k" para los mapas de
+# estaciones. Cada estación se asigna a su estado con una sola consulta al índice
+# espacial (STRtree) de los estados, y los polígonos de Voronoi de un conjunto de
+# estaciones se guardan en el directorio del almacén y en memoria: volver a
+# dibujar el mapa con otro subconjunto de estados solo filtra filas.
+
+voronoi_directory = geometry_store_directory
+exclude_states = {"ALASKA", "HAWAII", "PUERTO RICO"}
+stations_map_layer = "states_500k"
+
+_contiguous_states = {}
+_voronoi_cache = {}
+
+
+def contiguous_states(layer="states"):
+    """Los 48 estados contiguos de la capa `layer` (NAME en mayúsculas). No modificar: usar `.copy()`."""
+    if layer not in _contiguous_states:
+        gdf_usa = load_layer(layer).drop(columns=["geometry_5070"])
+        gdf_usa["NAME"] = gdf_usa["NAME"].str.upper()
+        _contiguous_states[layer] = gdf_usa[~gdf_usa["NAME"].isin(exclude_states)].reset_index(drop=True)
+    return _contiguous_states[layer]
+
+def assign_stations_to_states(df_stations, gdf_states):
+    """
+    Nombre del estado de cada estación. Las estaciones que no caen dentro de
+    ningún polígono (p. ej. en la costa, por la geometría simplificada) reciben
+    el estado más cercano.
+
+    Retorna:
+        pd.Series: NAME del estado, con el índice de `df_stations`.
+    """
+    points = gpd.GeoSeries(gpd.points_from_xy(df_stations["longitude"], df_stations["latitude"]), crs="EPSG:4326")
+    points = points.to_crs(gdf_states.crs)
+    state_idx = np.full(len(points), -1)
+    station_pos, tree_pos = gdf_states.sindex.query(points.values, predicate="within")
+    # Si una estación está en el borde de dos estados se toma el primero
+    station_pos, first = np.unique(station_pos, return_index=True)
+    state_idx[station_pos] = tree_pos[first]
+    outside = np.flatnonzero(state_idx < 0)
+    if len(outside):
+        nearest_pos, nearest_tree = gdf_states.sindex.nearest(points.values[outside], return_all=False)
+        state_idx[outside[nearest_pos]] = nearest_tree
+    return pd.Series(gdf_states["NAME"].to_numpy()[state_idx], index=df_stations.index, name="state_name")
+
+def filter_stations(df_stations, gdf_states, states=None):
+    """Estaciones ubicadas en `states` (por defecto en cualquiera de `gdf_states`), con su `state_name`."""
+    state_names = assign_stations_to_states(df_stations, gdf_states)
+    selected = set(gdf_states["NAME"]) if states is None else {state.upper() for state in states}
+    mask = state_names.isin(selected)
+    return df_stations[mask].assign(state_name=state_names[mask])
+
+def _stations_key(df_stations):
+    coords = np.column_stack((df_stations["longitude"], df_stations["latitude"])).astype("float64")
+    coords = coords[np.lexsort((coords[:, 1], coords[:, 0]))]
+    return hashlib.sha256(coords.tobytes()).hexdigest()[:16]
+
+def get_voronoi_polygons(df_stations, layer=stations_map_layer):
+    """
+    Polígonos de Voronoi de las estaciones recortados al contorno de los estados
+    contiguos de la capa `layer`, en EPSG:4326, con la longitude/latitude de la
+    estación de cada polígono. Se calculan una vez por conjunto de estaciones y
+    capa y se guardan en `voronoi_directory`.
+    """
+    key = f"{layer}_{_stations_key(df_stations)}"
+    voronoi = _voronoi_cache.get(key)
+    if voronoi is not None:
+        return voronoi
+    path = os.path.join(voronoi_directory, f"stations_voronoi_{key}.parquet")
+    if os.path.exists(path):
+        voronoi = _voronoi_cache[key] = gpd.read_parquet(path)
+        return voronoi
+
+    # Proyectar estaciones a Albers USA (EPSG:5070) para Voronoi
+    gdf_stations_albers = gpd.GeoDataFrame(
+        df_stations[["longitude", "latitude"]],
+        geometry=gpd.points_from_xy(df_stations["longitude"], df_stations["latitude"]),
+        crs="EPSG:4326"
+    ).to_crs("EPSG:5070")
+    points_albers = np.column_stack((gdf_stations_albers.geometry.x,
+                                     gdf_stations_albers.geometry.y))
+    vor = Voronoi(points_albers)
+
+    polygons = []
+    station_positions = []
+    for i, region_idx in enumerate(vor.point_region):
+        region = vor.regions[region_idx]
+        if not region or -1 in region:
+            # regiones infinitas, se ignoran
+            continue
+        polygons.append(Polygon([vor.vertices[j] for j in region]))
+        station_positions.append(i)
+
+    gdf_voronoi_albers = gpd.GeoDataFrame(
+        gdf_stations_albers[["longitude", "latitude"]].iloc[station_positions].reset_index(drop=True),
+        geometry=polygons,
+        crs="EPSG:5070"
+    )
+    # Clip al contorno de EE.UU. para no mostrar Voronoi infinito
+    gdf_usa_albers_dissolved = contiguous_states(layer)[["geometry"]].to_crs("EPSG:5070").dissolve()
+    voronoi = gpd.clip(gdf_voronoi_albers, gdf_usa_albers_dissolved).to_crs("EPSG:4326")
+
+    os.makedirs(voronoi_directory, exist_ok=True)
+    voronoi.to_parquet(path)
+    _voronoi_cache[key] = voronoi
+    return voronoi
+
 def plot_selected_states(dict_states):
     """
     Genera un mapa coroplético de EE.UU. destacando los estados con datos en dict_states
     y muestra la cantidad de registros junto con el nombre del estado.
     """
 
-    # 1. Cargar el shapefile de los estados de EE.UU.
-    gdf_usa = gpd.read_file("shape_files/state/cb_2018_us_state_20m.shp")  # Asegúrate de la ruta correcta
-
-    # 2. Normalizar nombres de los estados en el shapefile
-    gdf_usa["NAME"] = gdf_usa["NAME"].str.upper()
-
-    # 3. Filtrar solo los 48 estados contiguos de EE.UU. (excluir Alaska, Hawái y Puerto Rico)
-    exclude_states = {"ALASKA", "PUERTO RICO", "HAWAII"}
-    gdf_usa = gdf_usa[~gdf_usa["NAME"].isin(exclude_states)]
+    # 1-3. Los 48 estados contiguos de EE.UU. con NAME en mayúsculas
+    gdf_usa = contiguous_states().copy()
 
     # 4. Unir los datos con el GeoDataFrame del mapa de EE.UU.
     gdf_usa["value"] = gdf_usa["NAME"].map(dict_states)
@@ -29,10 +137,9 @@ def plot_selected_states(dict_states):
     # 5. Rellenar con 0 en estados sin datos
     gdf_usa["value"] = gdf_usa["value"].fillna(0)
 
-    # 6. Calcular coordenadas del centroide de cada estado (para colocar los textos)
-    gdf_usa["centroid"] = gdf_usa.geometry.centroid
-    gdf_usa["lat"] = gdf_usa["centroid"].y
-    gdf_usa["lon"] = gdf_usa["centroid"].x
+    # 6. Coordenadas del centroide de cada estado (precalculadas, para colocar los textos)
+    gdf_usa["lat"] = gdf_usa["lat_centroid"]
+    gdf_usa["lon"] = gdf_usa["lon_centroid"]
 
     # 7. Crear el mapa interactivo con Plotly
     fig = px.choropleth(
@@ -74,21 +181,15 @@ def plot_selected_states(dict_states):
 
     fig.show()
 
-def plot_states_with_filtered_stations(dict_states, df_stations):
+def plot_states_with_filtered_stations(dict_states, df_stations, states=None):
     """
     Genera un mapa coroplético de EE.UU. destacando los estados con datos en dict_states
-    y superpone solo las estaciones de monitoreo ubicadas en los estados de interés.
+    y superpone solo las estaciones de monitoreo ubicadas en los estados de interés
+    (`states`, por defecto los 48 estados contiguos).
     """
 
-    # 1. Cargar el shapefile de los estados de EE.UU. desde GeoJSON en línea
-    gdf_usa = gpd.read_file("https://eric.clst.org/assets/wiki/uploads/Stuff/gz_2010_us_040_00_500k.json")
-
-    # 2. Normalizar nombres de los estados en el shapefile
-    gdf_usa["NAME"] = gdf_usa["NAME"].str.upper()
-
-    # 3. Filtrar solo los 48 estados contiguos de EE.UU.
-    exclude_states = {"ALASKA", "PUERTO RICO", "HAWAII"}
-    gdf_usa = gdf_usa[~gdf_usa["NAME"].isin(exclude_states)]
+    # 1-3. Los 48 estados contiguos de EE.UU. con NAME en mayúsculas
+    gdf_usa = contiguous_states(stations_map_layer).copy()
 
     # 4. Unir los datos con el GeoDataFrame del mapa de EE.UU.
     gdf_usa["value"] = gdf_usa["NAME"].map(dict_states).fillna(0)
@@ -107,8 +208,8 @@ def plot_states_with_filtered_stations(dict_states, df_stations):
         height=700
     )
 
-    # 6. Filtrar estaciones que estén en estados válidos
-    df_stations_filtered = df_stations[~df_stations["stateCode"].isin({"AK", "HI", "PR"})]
+    # 6. Filtrar estaciones que estén en estados válidos (una consulta al índice espacial)
+    df_stations_filtered = filter_stations(df_stations, contiguous_states(stations_map_layer), states)
 
     # 7. Agregar puntos de las estaciones filtradas al mapa
     fig.add_trace(go.Scattergeo(
@@ -135,7 +236,7 @@ def plot_states_with_filtered_stations(dict_states, df_stations):
 
     fig.show()
 
-def plot_states_with_filtered_stations_voronoi(dict_states, df_stations):
+def plot_states_with_filtered_stations_voronoi(dict_states, df_stations, states=None):
     """
     Genera un mapa coroplético de EE.UU. destacando los estados con datos en dict_states,
     superpone las estaciones de monitoreo y dibuja los polígonos de Voronoi en torno
@@ -151,22 +252,15 @@ def plot_states_with_filtered_stations_voronoi(dict_states, df_stations):
          - 'longitude' (float): Longitud de la estación
          - 'latitude'  (float): Latitud de la estación
          - 'name'      (str)  : Nombre de la estación (opcional para hover)
-         - 'stateCode' (str)  : Código del estado (por ej. 'CA', 'NY', etc.)
+    states: list[str], opcional
+        Estados cuyas estaciones y polígonos se dibujan (por defecto los 48 contiguos).
+        El Voronoi se calcula una sola vez con todas las estaciones contiguas.
     """
 
     # -------------------------------------------------------------------
-    # 1. Cargar shapefile de EE.UU. (GeoJSON en línea) y normalizar nombres
-    # -------------------------------------------------------------------
-    gdf_usa = gpd.read_file(
-        "https://eric.clst.org/assets/wiki/uploads/Stuff/gz_2010_us_040_00_500k.json"
-    )
-    gdf_usa["NAME"] = gdf_usa["NAME"].str.upper()
-
-    # -------------------------------------------------------------------
-    # 2. Filtrar solo los 48 estados contiguos (excluir Alaska, Hawái, Puerto Rico)
+    # 1-2. Los 48 estados contiguos (sin Alaska, Hawái, Puerto Rico)
     # -------------------------------------------------------------------
-    exclude_states = {"ALASKA", "HAWAII", "PUERTO RICO"}
-    gdf_usa = gdf_usa[~gdf_usa["NAME"].isin(exclude_states)]
+    gdf_usa = contiguous_states(stations_map_layer).copy()
 
     # -------------------------------------------------------------------
     # 3. Agregar valores desde dict_states a gdf_usa (para el coroplético)
@@ -190,62 +284,23 @@ def plot_states_with_filtered_stations_voronoi(dict_states, df_stations):
     )
 
     # -------------------------------------------------------------------
-    # 5. Crear GeoDataFrame de estaciones y filtrar (sin AK, HI, PR)
-    # -------------------------------------------------------------------
-    df_stations_filtered = df_stations[
-        ~df_stations["stateCode"].isin({"AK", "HI", "PR"})
-    ].copy()
-    
-    # GeoDataFrame en EPSG:4326
-    gdf_stations = gpd.GeoDataFrame(
-        df_stations_filtered,
-        geometry=gpd.points_from_xy(
-            df_stations_filtered["longitude"], 
-            df_stations_filtered["latitude"]
-        ),
-        crs="EPSG:4326"
-    )
-
-    # -------------------------------------------------------------------
-    # 6. Proyectar estaciones a Albers USA (EPSG:5070) para Voronoi
-    # -------------------------------------------------------------------
-    gdf_stations_albers = gdf_stations.to_crs("EPSG:5070")
-
-    # -------------------------------------------------------------------
-    # 7. Calcular Voronoi en la proyección Albers
-    # -------------------------------------------------------------------
-    points_albers = np.column_stack((gdf_stations_albers.geometry.x,
-                                     gdf_stations_albers.geometry.y))
-    vor = Voronoi(points_albers)
-
-    polygons = []
-    for region_index in vor.regions:
-        if not region_index:
-            continue
-        if -1 in region_index:
-            # regiones infinitas, se ignoran
-            continue
-        polygon_coords = [vor.vertices[i] for i in region_index]
-        poly = Polygon(polygon_coords)
-        polygons.append(poly)
-
-    # Crear GeoDataFrame de polígonos Voronoi (en Albers)
-    gdf_voronoi_albers = gpd.GeoDataFrame(geometry=polygons, crs="EPSG:5070")
-
-    # -------------------------------------------------------------------
-    # 8. Clip al contorno de EE.UU. para no mostrar Voronoi infinito
+    # 5. Estaciones de los estados contiguos (una consulta al índice espacial)
     # -------------------------------------------------------------------
-    # Reproyectar gdf_usa a Albers
-    gdf_usa_albers = gdf_usa.to_crs("EPSG:5070")
-    # Unir (disolver) todos los estados en un solo polígono
-    gdf_usa_albers_dissolved = gdf_usa_albers.dissolve()
-    # Recortar Voronoi con contorno
-    gdf_voronoi_clipped_albers = gpd.clip(gdf_voronoi_albers, gdf_usa_albers_dissolved)
+    contiguous_stations = filter_stations(df_stations, contiguous_states(stations_map_layer))
 
     # -------------------------------------------------------------------
-    # 9. Regresar Voronoi a EPSG:4326 para Plotly
+    # 6-9. Voronoi en Albers recortado a EE.UU. y devuelto a EPSG:4326 (en caché)
     # -------------------------------------------------------------------
-    gdf_voronoi_clipped = gdf_voronoi_clipped_albers.to_crs("EPSG:4326")
+    gdf_voronoi_clipped = get_voronoi_polygons(contiguous_stations, stations_map_layer)
+
+    if states is None:
+        df_stations_filtered = contiguous_stations
+    else:
+        selected = {state.upper() for state in states}
+        df_stations_filtered = contiguous_stations[contiguous_stations["state_name"].isin(selected)]
+        station_coords = pd.MultiIndex.from_arrays([df_stations_filtered["longitude"], df_stations_filtered["latitude"]])
+        polygon_coords = pd.MultiIndex.from_arrays([gdf_voronoi_clipped["longitude"], gdf_voronoi_clipped["latitude"]])
+        gdf_voronoi_clipped = gdf_voronoi_clipped[polygon_coords.isin(station_coords)]
 
     # -------------------------------------------------------------------
     # 10. Dibujar polígonos Voronoi en el mapa (capa adicional)
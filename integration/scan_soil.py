@@ -1,7 +1,8 @@
 import os
-import time
 import requests
 import pandas as pd
+from utils import http_client
+from utils.rate_limiter import get_rate_limiter
 
 ########################################
 # CONFIGURACIÓN
@@ -23,8 +24,11 @@ OUTPUT_CSV = "antenas_scan_soil.csv"
 # Número máximo de reintentos cuando ocurre un error 429 o de conexión
 MAX_RETRIES = 5
 
-# Tiempo fijo de espera tras cada llamada exitosa (para no saturar la API)
-FIXED_SLEEP_BETWEEN_CALLS = 3
+# URL de la API si SOILGRID_API_URL no está definida
+soilgrids_default_url = "https://rest.isric.org/soilgrids/v2.0/properties/query"
+
+# El ritmo de llamadas lo controla el limitador compartido de SoilGrids
+SOILGRIDS_LIMITER = get_rate_limiter("soilgrids")
 
 
 ########################################
@@ -50,85 +54,55 @@ def get_soil_data(lat, lon, properties, max_retries=5):
     """
     # Construir query de múltiples propiedades
     # Se arma como: ?property=bdod&property=cec&property=clay ...
-    prop_query = "&".join([f"property={prop}" for prop in properties])
-    url = f"https://rest.isric.org/soilgrids/v2.0/properties/query?lon={lon}&lat={lat}&{prop_query}"
-    print(url)
-    delay = 2  # Espera inicial si recibimos 429
-    for attempt in range(1, max_retries + 1):
-        try:
-            response = requests.get(url, timeout=10)
-            print(response)
-            if response.status_code == 200:
-                data = response.json()
-                layers = data.get("properties", {}).get("layers", [])
-                
-                # Preparar un diccionario para almacenar resultados
-                results = {}
-                # Inicializar todas las props en None
-                for prop in properties:
-                    results[f"{prop}_0_30cm"] = None
-                
-                # Recorrer cada capa devuelta por la API
-                # Cada capa es un dict con "name": <prop>, "unit":..., "depths": [...]
-                for layer in layers:
-                    layer_name = layer.get("name", "")
-                    
-                    # Solo nos interesan las capas que coincidan con alguna de las props
-                    if layer_name in properties:
-                        depths = layer.get("depths", [])
-                        mean_values = []
-                        
-                        # Extraer la subcapa para 0-30 cm
-                        for d in depths:
-                            top = d["range"]["top_depth"]
-                            bottom = d["range"]["bottom_depth"]
-                            if bottom > 0 and top < 30:
-                                val = d["values"].get("mean", None)
-                                if val is not None:
-                                    mean_values.append(val)
-                        
-                        if mean_values:
-                            avg_val = round(sum(mean_values) / len(mean_values), 2)
-                            results[f"{layer_name}_0_30cm"] = avg_val
-                
-                return results
+    # Se lee en cada llamada (como data/get_soil_data.py) para poder apuntar a utils.replay_server
+    url = os.environ.get("SOILGRID_API_URL", soilgrids_default_url)
+    params = {"lon": lon, "lat": lat, "property": list(properties)}
+    print(url, params)
+    # Reintentos (429, 5xx, conexión) y limitador compartido en el cliente HTTP común
+    try:
+        response = http_client.get(url, params=params, timeout=10, max_retries=max(0, max_retries - 1), rate_limiter=SOILGRIDS_LIMITER)
+    except requests.exceptions.RequestException as e:
+        print(f"Excepción en la solicitud tras {max_retries} intentos: {e}")
+        return {f"{prop}_0_30cm": None for prop in properties}
+    print(response)
+
+    if response.status_code == 200:
+        data = response.json()
+        layers = data.get("properties", {}).get("layers", [])
+        
+        # Preparar un diccionario para almacenar resultados
+        results = {}
+        # Inicializar todas las props en None
+        for prop in properties:
+            results[f"{prop}_0_30cm"] = None
+        
+        # Recorrer cada capa devuelta por la API
+        # Cada capa es un dict con "name": <prop>, "unit":..., "depths": [...]
+        for layer in layers:
+            layer_name = layer.get("name", "")
             
-            elif response.status_code == 429:
-                # Rate limit
-                print(f"Recibido 429 (Too Many Requests) en intento {attempt}/{max_retries} para {lat}, {lon}")
+            # Solo nos interesan las capas que coincidan con alguna de las props
+            if layer_name in properties:
+                depths = layer.get("depths", [])
+                mean_values = []
                 
-                # Chequeamos Retry-After
-                retry_after = response.headers.get("Retry-After")
-                if retry_after is not None:
-                    try:
-                        delay = int(retry_after)
-                    except ValueError:
-                        pass
+                # Extraer la subcapa para 0-30 cm
+                for d in depths:
+                    top = d["range"]["top_depth"]
+                    bottom = d["range"]["bottom_depth"]
+                    if bottom > 0 and top < 30:
+                        val = d["values"].get("mean", None)
+                        if val is not None:
+                            mean_values.append(val)
                 
-                if attempt < max_retries:
-                    print(f"Esperando {delay} seg antes de reintentar...")
-                    time.sleep(delay)
-                    delay *= 2  # Exponential backoff
-                else:
-                    print("Se alcanzó el número máximo de reintentos con 429.")
-                    # Devuelve None para todas las propiedades
-                    return {f"{prop}_0_30cm": None for prop in properties}
-            
-            else:
-                # Otro código HTTP
-                print(f"Respuesta inesperada: {response.status_code} (Intento {attempt}/{max_retries}).")
-                # Podríamos imprimir response.text si necesitamos más debug
-                if attempt < max_retries:
-                    time.sleep(2)
-                else:
-                    return {f"{prop}_0_30cm": None for prop in properties}
+                if mean_values:
+                    avg_val = round(sum(mean_values) / len(mean_values), 2)
+                    results[f"{layer_name}_0_30cm"] = avg_val
         
-        except requests.exceptions.RequestException as e:
-            print(f"Excepción en la solicitud (Intento {attempt}/{max_retries}): {e}")
-            if attempt < max_retries:
-                time.sleep(2)
-            else:
-                return {f"{prop}_0_30cm": None for prop in properties}
+        return results
+
+    # Otro código HTTP tras agotar los reintentos
+    print(f"Respuesta inesperada: {response.status_code} tras {max_retries} intentos.")
 
     # Si se agotan los reintentos sin éxito
     return {f"{prop}_0_30cm": None for prop in properties}
@@ -174,9 +148,6 @@ def main():
         # Rellenar el DataFrame con los valores devueltos
         for prop, val in props_dict.items():
             df.at[i, prop] = val
-        
-        # Pausa para evitar saturar la API
-        time.sleep(FIXED_SLEEP_BETWEEN_CALLS)
     
     # 4. Guardar el resultado
     df.to_csv(OUTPUT_CSV, index=False)
@@ -1,14 +1,18 @@
 import os
 import pandas as pd
 from utils.states_codes import state_fips_to_abbr
+from utils.journal import IngestionJournal
+from utils import telemetry
+from utils.storage import save_dataframe, read_dataframe
 from dotenv import load_dotenv
 from data.get_nasa import get_climate_missing_values, save_climate_missing_values
 from data.get_crop_yield_data import get_crop_yield, save_crop_yield_data
 from data.get_soil_data import get_soil_scan_stations_dataframe, save_soil_scan_stations_dataframe
-from utils.aux_functions import create_historical_monthly_climate_data_by_scan_station, save_historical_monthly_climate_data_by_scan_station, impute_soil_moisture_depth_8, scan_stations_in_corn_belt_states
-from data.get_climate_data import get_scan_stations_data, get_station_data, save_scan_stations_data
-from data.get_centroids import get_counties_centroids, save_counties_centroids, get_counties_centroids_cornbelt, save_counties_centroids_cornbelt, assign_scan_station_to_cb_yield_counties
-from data.merge_data import merge_monthly_scan_stations_with_soil, save_monthly_climate_soil_data_by_scan_station, merge_counties_crop_yield_with_scan_stations, merge_counties_crop_yield_with_historical_scan_stations, save_crop_yield_scan_stations, save_counties_crop_yield_with_historical_scan_stations, save_historical_monthly_climate_imputed_data_by_scan_stations
+from utils.aux_functions import create_historical_monthly_climate_data_by_scan_station, save_historical_monthly_climate_data_by_scan_station, read_historical_monthly_climate_data_by_scan_station, upsert_historical_monthly_climate_data, impute_soil_moisture_depth_8, scan_stations_in_corn_belt_states
+from data.get_climate_data import get_scan_stations_data, get_station_data, get_station_data_incremental, save_scan_stations_data, last_complete_month, month_end
+from data.get_centroids import get_cornbelt_counties, get_counties_centroids, save_counties_centroids, get_counties_centroids_cornbelt, save_counties_centroids_cornbelt, assign_scan_station_to_cb_yield_counties, get_county_station_neighbors
+from data.interpolate_features import interpolate_county_features, save_county_idw_features, idw_neighbors
+from data.merge_data import merge_monthly_scan_stations_with_soil, save_monthly_climate_soil_data_by_scan_station, merge_counties_crop_yield_with_scan_stations, merge_counties_crop_yield_with_historical_scan_stations, merge_counties_crop_yield_with_idw_features, save_crop_yield_scan_stations, save_counties_crop_yield_with_historical_scan_stations, save_historical_monthly_climate_imputed_data_by_scan_stations
 
 load_dotenv()
 
@@ -19,7 +23,25 @@ load_dotenv()
 source_data_directory = os.environ.get("SOURCE_DATA_DIRECTORY")
 elements = "TMAX, TMIN, TAVG, PRCP, SMS:-8:1"
 soil_elements = ["phh2o", "ocd", "cec", "sand", "silt", "clay"]
+# "api" consulta SoilGrids por estación; "raster" usa las capas locales de SOILGRID_RASTER_DIRECTORY
+soil_backend = "api"
 duration = "MONTHLY"
+# Consultas simultáneas a AWDB
+scan_max_workers = 8
+# Estaciones por llamada a AWDB
+scan_batch_size = 10
+# Solo descargar los meses nuevos de cada estación
+incremental_refresh = True
+# Diarios de ingesta: permiten reanudar una descarga interrumpida
+journal_directory = f"{source_data_directory}/journal"
+scan_journal_path = f"{journal_directory}/scan_stations_data.jsonl"
+soil_journal_path = f"{journal_directory}/soil_scan_stations.jsonl"
+# Motor de los merges de data/merge_data.py: "pandas" (en memoria) o "duckdb" (fuera de memoria)
+merge_engine = os.environ.get("MERGE_ENGINE", "pandas")
+# Variables por condado: "station" (estación más cercana) o "idw" (promedio IDW de las k más cercanas)
+county_features_method = os.environ.get("COUNTY_FEATURES_METHOD", "station")
+# Reporte de consultas HTTP de la ejecución (JSON y formato Prometheus)
+report_directory = f"{source_data_directory}/reports"
 
 '''
 os.makedirs('source_data', exist_ok=True)
@@ -44,11 +66,25 @@ scan_stations_df = get_scan_stations_data()
 save_scan_stations_data(scan_stations_df)
 
 #Obtener un lista con datos de cada una de las estaciones
-stations_data_list = get_station_data(scan_stations_df, duration, elements)
+if incremental_refresh:
+    #Solo se consulta desde el último mes guardado de cada estación (se reemplaza)
+    stored_historical_monthly_climate_data = read_historical_monthly_climate_data_by_scan_station()
+    stations_data_list = get_station_data_incremental(scan_stations_df, duration, stored_historical_monthly_climate_data, elements, max_workers=scan_max_workers, batch_size=scan_batch_size, journal_path=scan_journal_path)
+else:
+    #Hasta el último mes terminado, para no guardar un mes a medias
+    stations_data_list = get_station_data(scan_stations_df, duration, elements, max_workers=scan_max_workers, batch_size=scan_batch_size, journal_path=scan_journal_path, end_date=month_end(*last_complete_month()))
 
 #Función para obtener los datos de cada estación
-historical_monthly_climate_data_by_scan_stations = create_historical_monthly_climate_data_by_scan_station(stations_data_list)
+if incremental_refresh and not stations_data_list:
+    #Todas las estaciones están al día: se conserva lo guardado
+    historical_monthly_climate_data_by_scan_stations = stored_historical_monthly_climate_data
+else:
+    historical_monthly_climate_data_by_scan_stations = create_historical_monthly_climate_data_by_scan_station(stations_data_list)
+    if incremental_refresh:
+        historical_monthly_climate_data_by_scan_stations = upsert_historical_monthly_climate_data(stored_historical_monthly_climate_data, historical_monthly_climate_data_by_scan_stations)
 save_historical_monthly_climate_data_by_scan_station(historical_monthly_climate_data_by_scan_stations)
+#Los datos ya están guardados: el diario no se necesita para la siguiente ejecución
+IngestionJournal(scan_journal_path).clear()
 
 #################################################
 #######Imput climate data#######################
@@ -70,7 +106,7 @@ months_of_interest = list(range(4, 11))
 historical_monthly_climate_data_apr_sept_by_scan_stations = historical_monthly_climate_imputed_data_by_scan_stations[historical_monthly_climate_imputed_data_by_scan_stations['month'].isin(months_of_interest)].reset_index(drop=True)
 
 # Guardar el resultado en un nuevo archivo
-historical_monthly_climate_data_apr_sept_by_scan_stations.to_csv(f'{source_data_directory}/historical_monthly_climate_data_apr_sept_by_scan_stations.csv', index=False)
+save_dataframe(historical_monthly_climate_data_apr_sept_by_scan_stations, 'historical_monthly_climate_data_apr_sept_by_scan_stations')
 
 historical_monthly_climate_data_apr_sept_by_scan_stations = get_climate_missing_values(historical_monthly_climate_data_apr_sept_by_scan_stations)
 save_climate_missing_values(historical_monthly_climate_data_apr_sept_by_scan_stations)
@@ -80,15 +116,16 @@ save_climate_missing_values(historical_monthly_climate_data_apr_sept_by_scan_sta
 ########Obtener los datos de suelo####################
 ######################################################
 
-historical_monthly_climate_data_apr_sept_by_scan_stations = pd.read_csv(f'{source_data_directory}/historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa.csv')
+historical_monthly_climate_data_apr_sept_by_scan_stations = read_dataframe('historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa')
 
 ##Obtener los datos de cada estacion climatica para realizar la consulta de suelo sobre esa ubicación geografica.
-station_coords = historical_monthly_climate_data_apr_sept_by_scan_stations.groupby('stationTriplet')[['latitude', 'longitude']].first().reset_index()
+station_coords = historical_monthly_climate_data_apr_sept_by_scan_stations.groupby('stationTriplet', observed=True)[['latitude', 'longitude']].first().reset_index()
 print(station_coords)
 
 ## Funcion para obtener el soil data de cada estacion
-soil_data_by_scan_stations = get_soil_scan_stations_dataframe(station_coords, soil_elements)
+soil_data_by_scan_stations = get_soil_scan_stations_dataframe(station_coords, soil_elements, backend=soil_backend, journal_path=soil_journal_path)
 save_soil_scan_stations_dataframe(soil_data_by_scan_stations)
+IngestionJournal(soil_journal_path).clear()
 
 
 
@@ -96,45 +133,58 @@ save_soil_scan_stations_dataframe(soil_data_by_scan_stations)
 ###Obtener los datos de rendimiento de cultivo###
 #################################################
 
-historical_monthly_climate_data_apr_sept_by_scan_stations = pd.read_csv(f"{source_data_directory}/historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa.csv")
+historical_monthly_climate_data_apr_sept_by_scan_stations = read_dataframe('historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa')
 #Obtener los datos de rendimiento
 crop_yield_df = get_crop_yield()
 save_crop_yield_data(crop_yield_df)
 
 '''
-scan_stations_df = pd.read_csv(f"{source_data_directory}/scan_stations.csv")
-crop_yield_df = pd.read_csv(f'{source_data_directory}/crop_yield.csv')
-historical_monthly_climate_soil_data_apr_sept_by_scan_stations = pd.read_csv(f'{source_data_directory}/historical_monthly_climate_soil_data_apr_sept_by_scan_station.csv')
-#Obtener los centroides por cada condado
-counties_centroids, counties_cornbelt_wgs84 = get_counties_centroids(crop_yield_df, state_fips_to_abbr)
+scan_stations_df = read_dataframe('scan_stations')
+crop_yield_df = read_dataframe('crop_yield')
+historical_monthly_climate_soil_data_apr_sept_by_scan_stations = read_dataframe('historical_monthly_climate_soil_data_apr_sept_by_scan_station')
+#Asignar a cada condado su estación más cercana. Si la asignación ya está
+#guardada para estas estaciones y condados no se cargan las geometrías
+counties_nearest_usda_station = assign_scan_station_to_cb_yield_counties(scan_stations_df)
+
+#Obtener los centroides por cada condado (vienen en la asignación)
+counties_centroids, _ = get_counties_centroids(crop_yield_df, state_fips_to_abbr, counties_nearest_usda_station)
 save_counties_centroids(counties_centroids)
 
 #Filtrar solo los condados que pertenecen al cornbelt
 centroids_cornbelt_counties_crop_yield = get_counties_centroids_cornbelt(counties_centroids)
 save_counties_centroids_cornbelt(centroids_cornbelt_counties_crop_yield)
 
-counties_nearest_usda_station = assign_scan_station_to_cb_yield_counties(counties_cornbelt_wgs84, scan_stations_df)
-
 #################################################
 #############Merge data##########################
 #################################################
 
 ## Funcion para hacer merge entre datos de suelo por estacion y los datos mensuales de cada estacion.
 '''
-historical_monthly_climate_soil_data_apr_sept_by_scan_stations = merge_monthly_scan_stations_with_soil(soil_data_by_scan_stations, historical_monthly_climate_data_apr_sept_by_scan_stations)
+historical_monthly_climate_soil_data_apr_sept_by_scan_stations = merge_monthly_scan_stations_with_soil(soil_data_by_scan_stations, historical_monthly_climate_data_apr_sept_by_scan_stations, engine=merge_engine)
 save_monthly_climate_soil_data_by_scan_station(historical_monthly_climate_soil_data_apr_sept_by_scan_stations)
 '''
 
-## Funcion para hacer cruce de datos de rendimiento de cada estado con los datos de clima y suelo.
-crop_yield_by_scan_stations = merge_counties_crop_yield_with_scan_stations(centroids_cornbelt_counties_crop_yield, counties_nearest_usda_station)
-save_crop_yield_scan_stations(crop_yield_by_scan_stations)
-
-
-######## Check point##########
-monthly_historical_climate_soil_crop_yield_data_by_scan_stations = merge_counties_crop_yield_with_historical_scan_stations(crop_yield_by_scan_stations, historical_monthly_climate_soil_data_apr_sept_by_scan_stations)
+if county_features_method == "idw":
+    ## Clima y suelo de cada condado interpolados desde sus k estaciones más cercanas
+    county_station_neighbors = get_county_station_neighbors(get_cornbelt_counties(state_fips_to_abbr), scan_stations_df, k=idw_neighbors)
+    county_idw_features = interpolate_county_features(county_station_neighbors, historical_monthly_climate_soil_data_apr_sept_by_scan_stations)
+    save_county_idw_features(county_idw_features)
+    monthly_historical_climate_soil_crop_yield_data_by_scan_stations = merge_counties_crop_yield_with_idw_features(centroids_cornbelt_counties_crop_yield, county_idw_features, engine=merge_engine)
+else:
+    ## Funcion para hacer cruce de datos de rendimiento de cada estado con los datos de clima y suelo.
+    crop_yield_by_scan_stations = merge_counties_crop_yield_with_scan_stations(centroids_cornbelt_counties_crop_yield, counties_nearest_usda_station)
+    save_crop_yield_scan_stations(crop_yield_by_scan_stations)
+
+    ######## Check point##########
+    monthly_historical_climate_soil_crop_yield_data_by_scan_stations = merge_counties_crop_yield_with_historical_scan_stations(crop_yield_by_scan_stations, historical_monthly_climate_soil_data_apr_sept_by_scan_stations, engine=merge_engine)
 save_counties_crop_yield_with_historical_scan_stations(monthly_historical_climate_soil_crop_yield_data_by_scan_stations)
 
 #######Proceso de imputacion de soil moisture -8#####
 
 
+#################################################
+#############Reporte de ingesta##################
+#################################################
+telemetry.write_report(f"{report_directory}/ingestion_report.json", f"{report_directory}/ingestion_metrics.prom")
+
 print("Proceso terminado exitosamente")
\ No newline at end of file
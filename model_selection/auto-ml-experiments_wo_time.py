@@ -3,6 +3,7 @@ from pathlib import Path
 import logging
 import pandas as pd
 from dotenv import load_dotenv
+from utils.storage import load_modeling_dataset
 
 import mlflow
 import mlflow.sklearn
@@ -26,11 +27,9 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def load_data(path: Path) -> pd.DataFrame:
-    """Carga el dataset desde una ruta dada."""
-    if not path.exists():
-        raise FileNotFoundError(f"Archivo no encontrado: {path}")
-    return pd.read_csv(path)
+def load_data(directory: Path) -> pd.DataFrame:
+    """Carga el dataset de modelado con el cargador común (tipos reducidos)."""
+    return load_modeling_dataset(directory=str(directory))
 
 
 def prepare_data(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.Series]:
@@ -122,7 +121,7 @@ def main():
         return
 
     # 1) Carga de datos
-    data_path = Path(data_dir) / "historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa_final.csv"
+    data_path = Path(data_dir)
     df = load_data(data_path)
     X, y = prepare_data(df)
 
@@ -3,6 +3,7 @@ from pathlib import Path
 import logging
 import pandas as pd
 from dotenv import load_dotenv
+from utils.storage import load_modeling_dataset
 
 import mlflow
 import mlflow.sklearn
@@ -16,18 +17,18 @@ from pycaret.regression import (
 )
 
 
-def load_data(path: Path) -> pd.DataFrame:
-    """Carga el dataset desde una ruta dada."""
-    if not path.exists():
-        raise FileNotFoundError(f"Archivo no encontrado: {path}")
-    return pd.read_csv(path)
+# Estados del experimento: solo se leen sus particiones del dataset
+states = ['WISCONSIN', 'ILLINOIS', 'MINNESOTA']
+
+def load_data(directory: Path, states: list[str]) -> pd.DataFrame:
+    """Carga del dataset de modelado particionado solo los estados dados."""
+    return load_modeling_dataset(states=states, directory=str(directory))
 def prepare_data(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.Series]:
     """Separa características (X) y variable objetivo (y)."""
     drop_cols = [
         'Unnamed: 0', 'state_name', 'county_name', 'state_alpha', 'county_code', 'year', 'month', 'stationTriplet',
         'stationId', 'name', 'lat_centroid', 'lon_centroid', 'latitude', 'longitude', 'unit_desc', 
     ]
-    states = ['WISCONSIN', 'ILLINOIS', 'MINNESOTA']
     X = df[df['state_name'].isin(states)]
     y = X['Value']
     X = X.drop(columns=drop_cols + ['Value'], errors='ignore')
@@ -113,8 +114,8 @@ def main():
         return
 
     # 1) Carga de datos
-    data_path = Path(__file__).resolve().parent.parent / data_dir / "historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa_final.csv"
-    df = load_data(data_path)
+    data_path = Path(__file__).resolve().parent.parent / data_dir
+    df = load_data(data_path, states)
     X, y = prepare_data(df)
     print(f"tamaño de X: {X.shape}")
     print(f"tamaño de Y: {y.shape}")
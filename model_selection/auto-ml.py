@@ -1,6 +1,7 @@
 import os
 import pandas as pd
 from dotenv import load_dotenv
+from utils.storage import load_modeling_dataset
 from pycaret.regression import setup, compare_models, save_model, pull
 
 # =========================
@@ -54,7 +55,7 @@ def run_automl(X, y, save_path):
 def main():
     print("📦 Cargando dataset...")
     load_dotenv()
-    df = pd.read_csv(os.path.join(source_data_directory, 'historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa_final.csv'))
+    df = load_modeling_dataset()
 
     print("🔍 Preparando datos para AutoML...")
     
@@ -67,7 +68,7 @@ def main():
                          'lat_centroid',
                          'lon_centroid', 
                          'unit_desc', 
-                         'Value'})
+                         'Value'}, errors='ignore')
     y = df['Value']
 
     print("Columnas de X")
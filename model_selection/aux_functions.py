@@ -1,6 +1,10 @@
+import os
+import joblib
+import pandas as pd
+from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import StandardScaler, OrdinalEncoder
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, RandomizedSearchCV
 
 # =========================
 # SPLIT DE DATOS
@@ -17,4 +21,38 @@ def build_preprocessor(numerical_cols, categorical_cols):
     ('num', StandardScaler(), numerical_cols),
     ('cat', OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1), categorical_cols)
 ])
-    return preprocessor
\ No newline at end of file
+    return preprocessor
+
+# =========================
+# RANDOMIZED SEARCH
+# =========================
+def tune_model(name, estimator, params, X, y, preprocessor, scoring, models_results_path, best_models_path,
+               n_iter=20, cv=5):
+    """
+    Busca hiperparámetros de `estimator` con RandomizedSearchCV sobre el pipeline
+    preprocesador + modelo. Guarda los resultados de la búsqueda en
+    `models_results_path/<name>_cv_results.csv` y el mejor pipeline en
+    `best_models_path/<name>_best_model.pkl`.
+
+    Retorna:
+        float: RMSE promedio de validación cruzada del mejor modelo.
+    """
+    pipeline = Pipeline([('preprocessor', preprocessor), ('model', estimator)])
+    search = RandomizedSearchCV(
+        pipeline,
+        param_distributions={f'model__{k}': v for k, v in params.items()},
+        n_iter=n_iter,
+        cv=cv,
+        scoring=scoring,
+        refit='neg_root_mean_squared_error',
+        random_state=42,
+        n_jobs=-1,
+        verbose=1
+    )
+    print(f"🔍 Ejecutando RandomizedSearchCV para {name}...")
+    search.fit(X, y)
+
+    pd.DataFrame(search.cv_results_).to_csv(os.path.join(models_results_path, f"{name}_cv_results.csv"), index=False)
+    joblib.dump(search.best_estimator_, os.path.join(best_models_path, f"{name}_best_model.pkl"))
+    print(f"✅ Mejores parámetros de {name}: {search.best_params_}")
+    return -search.best_score_
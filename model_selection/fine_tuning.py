@@ -4,6 +4,7 @@ import logging
 import pandas as pd
 from pathlib import Path
 from dotenv import load_dotenv
+from utils.storage import load_modeling_dataset
 from pycaret.regression import setup, load_model, tune_model, pull, save_model
 
 logging.basicConfig(level=logging.INFO)
@@ -34,14 +35,14 @@ def main():
     print(f"model_path: {model_path}")
     
     # Cargar datos y preparar
-    data_path = Path(__file__).resolve().parent.parent / data_dir / "historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa_final.csv"
-    df = pd.read_csv(data_path)
     drop_cols = [
         'Unnamed: 0', 'state_name', 'county_name', 'state_alpha', 'county_code', 'year', 'month', 'stationTriplet',
         'stationId', 'name', 'lat_centroid', 'lon_centroid', 'latitude', 'longitude', 'unit_desc',
     ]
     states = ['IOWA', 'INDIANA', 'ILLINOIS']
-    df = df[df['state_name'].isin(states)]
+    # Solo se leen las particiones de estos estados
+    data_path = Path(__file__).resolve().parent.parent / data_dir
+    df = load_modeling_dataset(states=states, directory=str(data_path))
     y = df['Value']
     X = df.drop(columns=drop_cols + ['Value'], errors='ignore')
     df_exp = pd.concat([X, y.rename("target")], axis=1)
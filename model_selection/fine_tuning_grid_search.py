@@ -4,6 +4,8 @@ import logging
 import pandas as pd
 from pathlib import Path
 from dotenv import load_dotenv
+from utils.storage import load_modeling_dataset
+from utils.feature_cache import get_feature_matrix
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import GridSearchCV, cross_val_score
 from sklearn.metrics import make_scorer, r2_score
@@ -34,17 +36,20 @@ def main():
     best_models_dir.mkdir(parents=True, exist_ok=True)
     model_path = best_models_dir / "sklearn_rf_best_model.pkl"
     
-    data_path = Path(__file__).resolve().parent.parent / data_dir / "historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa_final.csv"
-    df = pd.read_csv(data_path)
 
     drop_cols = [
         'Unnamed: 0', 'state_name', 'county_name', 'state_alpha', 'county_code', 'year', 'month', 'stationTriplet',
         'stationId', 'name', 'lat_centroid', 'lon_centroid', 'latitude', 'longitude', 'unit_desc',
     ]
     states = ['IOWA', 'INDIANA', 'ILLINOIS']
-    df = df[df['state_name'].isin(states)]
-    y = df['Value']
-    X = df.drop(columns=drop_cols + ['Value'], errors='ignore')
+    # Solo se leen las particiones de estos estados
+    data_path = Path(__file__).resolve().parent.parent / data_dir
+    df = load_modeling_dataset(states=states, directory=str(data_path))
+    # X e y se leen con memoria mapeada desde la caché de características: los
+    # workers de GridSearchCV comparten el mismo archivo en lugar de recibir una copia
+    X, y, manifest = get_feature_matrix(df, drop_cols=drop_cols, target='Value')
+    del df
+    logger.info(f"Matriz de características {manifest['key']}: {X.shape[0]} filas x {X.shape[1]} columnas")
 
     # Hiperparámetros para GridSearch
     param_grid = {
@@ -2,6 +2,7 @@ import os
 import numpy as np
 import pandas as pd
 from dotenv import  load_dotenv
+from utils.storage import load_modeling_dataset
 import matplotlib.pyplot as plt
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
@@ -18,8 +19,8 @@ def preprocess_data(numerical_cols, categorical_cols):
 
 def run_pca(df, n_components=2, save_path=None, show_plot=True):
     categorical_cols = ['state_name', 'county_name']
-    numerical_cols = [col for col in df.columns if col not in categorical_cols + ['Value']]
-    X = df.drop(columns='Value')
+    numerical_cols = [col for col in df.select_dtypes('number').columns if col not in categorical_cols + ['Value']]
+    X = df[numerical_cols]
     y = df['Value']
     print("🔄 Escalando variables numéricas...")
     preprocessor = preprocess_data(numerical_cols, categorical_cols)
@@ -62,7 +63,7 @@ def main():
     models_results_path = os.path.join(results_path, models_path, experiment)
     best_models_path = os.path.join(models_results_path, 'best_models')
     summary_path = os.path.join(models_results_path, 'summary_best_models.csv')
-    df = pd.read_csv(os.path.join(source_data_directory, 'historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa_final.csv'))
+    df = load_modeling_dataset()
 
     print("🔍 Preparando datos para AutoML...")
     categorical_cols = ['state_name', 'county_name']
@@ -3,12 +3,13 @@ import pandas as pd
 import xgboost as xgb
 from sklearn.svm import SVR
 from dotenv import load_dotenv
+from utils.storage import load_modeling_dataset
+from utils.feature_cache import get_feature_matrix
 from scipy.stats import uniform, randint
 from sklearn.neural_network import MLPRegressor
 from sklearn.ensemble import RandomForestRegressor
-from model_selection.fine_tuning import tune_model
 from model_selection.metric_functions import get_scorers
-from model_selection.aux_functions import build_preprocessor 
+from model_selection.aux_functions import build_preprocessor, tune_model
 
 
 ##Posibles parametros de entrenamiento.
@@ -73,7 +74,7 @@ summary_path = f"{results_path}/{models_path}/{experiment}/summary_best_models.c
 def main():
     print("📦 Cargando dataset...")
     load_dotenv()
-    df = pd.read_csv(f'{source_data_directory}/historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa_final.csv')
+    df = load_modeling_dataset()
 
     #########Experimento 1##################
     #### Todas las variables son tomadas####
@@ -84,13 +85,21 @@ def main():
     ################# 1. Capturar variables categoricas y numericas#####################
     
     categorical_cols = ['state_name', 'county_name']
-    numerical_cols = [col for col in df.columns if col not in categorical_cols + ['Value']]
-    X = df.drop(columns='Value')
-    y = df['Value']
+    # Las demás columnas categóricas del esquema (identificadores) no se escalan
+    numerical_cols = [col for col in df.select_dtypes('number').columns if col not in categorical_cols + ['Value']]
+    # X e y salen de la caché de características (memoria mapeada); las columnas
+    # categóricas llegan ya como códigos
+    X, y, manifest = get_feature_matrix(df[numerical_cols + categorical_cols + ['Value']], target='Value')
+    del df
+    print(f"Matriz de características {manifest['key']}: {X.shape[0]} filas x {X.shape[1]} columnas")
     
     ########################### 2. Preprocesar los datos###############################
     
-    preprocessor, _, _ = build_preprocessor(numerical_cols, categorical_cols)
+    # X es un arreglo: el preprocesador selecciona las columnas por posición
+    columns = manifest['columns']
+    numerical_idx = [columns.index(col) for col in numerical_cols]
+    categorical_idx = [columns.index(col) for col in categorical_cols]
+    preprocessor = build_preprocessor(numerical_idx, categorical_idx)
     
     ########################### 3. Creacion de directorio###############################
     
@@ -1,7 +1,10 @@
 import os
+import numpy as np
 import pandas as pd
 from data.get_soil_data import get_soil_data
 from pathlib import Path
+from utils.storage import save_dataframe, read_dataframe, dataset_exists
+from utils.keys import register_station_keys
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -45,12 +48,23 @@ def scan_stations_in_corn_belt_states(
 
 
 def create_historical_monthly_climate_data_by_scan_station(stations_data_list): 
-    dfs_result = []
+    """
+    Construye la tabla ancha (una fila por estación, año y mes; una columna por
+    elemento) a partir de las respuestas de AWDB en una sola pasada.
+
+    Los valores se acumulan como triples (fila, columna, valor) sobre un índice
+    (estación, año, mes) y se vuelcan de una vez en una matriz preasignada, sin
+    crear un DataFrame ni un merge por elemento.
+    """
+    row_index = {}          # (posición de la estación, year, month) -> fila
+    column_index = {}       # nombre de la columna -> posición
+    row_ids, column_ids, values = [], [], []
+    stations_meta = []      # (stationTriplet, latitude, longitude) por posición
+
     for station_data in stations_data_list:
         stationTriplet = station_data['stationTriplet']
-        latitude = station_data['latitude']
-        longitude = station_data['longitude']
-        dfs = []
+        station_pos = len(stations_meta)
+        station_columns = set()
         for element_info in station_data['data']:
             element_code = element_info['stationElement']['elementCode']
             depth = element_info['stationElement'].get('heightDepth', '')
@@ -59,37 +73,86 @@ def create_historical_monthly_climate_data_by_scan_station(stations_data_list):
                 unique_column_name = f"{element_code}_{depth}".replace(":", "_")
             else:
                 unique_column_name = element_code.replace(":", "_")
-            df_temp = pd.DataFrame(element_info['values'])
+            element_values = [
+                v for v in element_info.get('values', [])
+                if 'year' in v and 'month' in v
+            ]
             # Validamos si 'value', 'year' y 'month' existen
-            if not {'value', 'year', 'month'}.issubset(df_temp.columns):
+            if not element_values or not any('value' in v for v in element_values):
                 print(f"Saltando {unique_column_name} por falta de columnas necesarias")
                 continue
-            # Renombrar la columna 'value' por su nombre único
-            df_temp = df_temp.rename(columns={'value': unique_column_name})
-            dfs.append(df_temp)
-            #print(f"✓ Añadido: {unique_column_name}")
-        if not dfs:
+            if unique_column_name in station_columns:
+                print(f"⚠️ Conflicto de columnas: {[unique_column_name]}")
+            station_columns.add(unique_column_name)
+            column = column_index.setdefault(unique_column_name, len(column_index))
+            for v in element_values:
+                key = (station_pos, v['year'], v['month'])
+                row = row_index.setdefault(key, len(row_index))
+                row_ids.append(row)
+                column_ids.append(column)
+                values.append(v.get('value'))
+        if not station_columns:
             print(f"⚠️ No hay datos válidos para la estación {stationTriplet}, se omite.")
+            # Las filas no se crearon: la posición se reutiliza para la siguiente estación
             continue
-
-        # Merge de todos los elementos
-        climate_df = dfs[0]
-        for df_temp in dfs[1:]:
-            common_cols = climate_df.columns.intersection(df_temp.columns).difference(['year', 'month'])
-            if not common_cols.empty:
-                print(f"⚠️ Conflicto de columnas: {common_cols.tolist()}")
-            climate_df = climate_df.merge(df_temp, on=['year', 'month'], how='outer')
-        # Añadir metadatos de estación
-        climate_df['stationTriplet'] = stationTriplet
-        climate_df['latitude'] = latitude
-        climate_df['longitude'] = longitude
-        dfs_result.append(climate_df)
-    monthly_climate_data_by_scan_stations = pd.concat(dfs_result, ignore_index=True)
+        stations_meta.append((stationTriplet, station_data['latitude'], station_data['longitude']))
+
+    if not row_index:
+        raise ValueError("No hay datos válidos para ninguna estación")
+
+    # Volcado en bloque sobre la matriz preasignada
+    matrix = np.full((len(row_index), len(column_index)), np.nan)
+    matrix[np.asarray(row_ids), np.asarray(column_ids)] = np.asarray(values, dtype=float)
+
+    keys = np.array(list(row_index.keys()), dtype=np.int64)
+    # Orden fijo: estaciones en el orden de la lista y, dentro de cada una, por año y mes.
+    # (El orden del merge 'outer' anterior dependía de la versión de pandas; solo coincide con este
+    # cuando pandas ordena las llaves, como en los CSV de source_data.)
+    order = np.lexsort((keys[:, 2], keys[:, 1], keys[:, 0]))
+    keys = keys[order]
+    station_positions = keys[:, 0]
+
+    monthly_climate_data_by_scan_stations = pd.DataFrame({'month': keys[:, 2], 'year': keys[:, 1]})
+    for name, column in column_index.items():
+        monthly_climate_data_by_scan_stations[name] = matrix[order, column]
+    # Añadir metadatos de estación
+    triplets, latitudes, longitudes = (np.array(meta, dtype=object) for meta in zip(*stations_meta))
+    monthly_climate_data_by_scan_stations['stationTriplet'] = triplets[station_positions]
+    monthly_climate_data_by_scan_stations['latitude'] = latitudes[station_positions].astype(float)
+    monthly_climate_data_by_scan_stations['longitude'] = longitudes[station_positions].astype(float)
     return monthly_climate_data_by_scan_stations
 
 def save_historical_monthly_climate_data_by_scan_station(monthly_climate_data_by_scan_station): 
-    os.makedirs('source_data', exist_ok=True)
-    monthly_climate_data_by_scan_station.to_csv(f'{source_data_directory}/historical_monthly_climate_data_by_scan_station.csv', index=False)
+    # La llave station_key se asigna al guardar (registro station_keys, utils/keys.py)
+    save_dataframe(register_station_keys(monthly_climate_data_by_scan_station), 'historical_monthly_climate_data_by_scan_station')
+
+def read_historical_monthly_climate_data_by_scan_station():
+    name = 'historical_monthly_climate_data_by_scan_station'
+    if not dataset_exists(name):
+        return pd.DataFrame()
+    return read_dataframe(name)
+
+def upsert_historical_monthly_climate_data(existing_df, new_df, keys=("stationTriplet", "year", "month")):
+    """
+    Inserta o reemplaza en `existing_df` las filas de `new_df` según `keys`.
+    Las filas nuevas tienen prioridad (p. ej. el último mes, que puede venir incompleto).
+    Se conserva el orden de aparición de las estaciones y dentro de cada una el orden por año y mes.
+    """
+    if existing_df is None or existing_df.empty:
+        return new_df.reset_index(drop=True)
+    if new_df is None or new_df.empty:
+        return existing_df.reset_index(drop=True)
+
+    keys = list(keys)
+    combined = pd.concat([existing_df, new_df], ignore_index=True)
+    combined = combined.drop_duplicates(subset=keys, keep="last")
+    station_order = pd.Categorical(combined["stationTriplet"], categories=pd.unique(combined["stationTriplet"]), ordered=True)
+    combined = (
+        combined.assign(_station_order=station_order)
+        .sort_values(["_station_order", "year", "month"], kind="stable")
+        .drop(columns="_station_order")
+    )
+    return combined.reset_index(drop=True)
 
 def impute_soil_moisture_depth_8(df):
     df["date"] = pd.to_datetime(dict(year=df["year"], month=df["month"], day=1))
@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import logging
+import shutil
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+#################################################
+#####Caché de matrices de características########
+#################################################
+# Los scripts de model_selection/ arman X e y a partir del mismo dataset con su
+# propia lista de columnas a descartar. Aquí la matriz numérica ya codificada
+# (X, float32) y el objetivo (y) se guardan una sola vez por combinación
+# (hash del dataset, columnas) como archivos .npy, junto con un manifest.json
+# con los nombres de las columnas y las categorías de cada columna codificada:
+#
+#   <feature_cache_directory>/<llave>/X.npy
+#   <feature_cache_directory>/<llave>/y.npy
+#   <feature_cache_directory>/<llave>/manifest.json
+#
+# Los arreglos se abren con memoria mapeada (np.memmap). joblib pasa los memmap
+# a los procesos de GridSearchCV/cross_val_score como referencia al archivo, de
+# modo que todos los workers leen las mismas páginas sin copiar ni serializar X.
+#
+# La usan los scripts de sklearn (fine_tuning_grid_search.py, randomized_search.py).
+# Los de PyCaret (auto-ml*.py, fine_tuning.py) siguen recibiendo un DataFrame,
+# porque `setup` necesita los nombres y tipos de las columnas.
+
+feature_cache_directory = os.environ.get("FEATURE_CACHE_DIRECTORY", ".cache/features")
+feature_dtype = np.float32
+
+
+def dataset_fingerprint(df: pd.DataFrame) -> str:
+    """Hash del contenido de `df` (valores, nombres y tipos de columnas)."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def feature_key(fingerprint: str, feature_columns: list[str], target: str) -> str:
+    payload = json.dumps({"dataset": fingerprint, "features": list(feature_columns), "target": target})
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+def encode_features(X: pd.DataFrame) -> tuple[np.ndarray, dict]:
+    """
+    Convierte `X` a una matriz float32 contigua. Las columnas categóricas y de
+    texto se reemplazan por su código (los nulos quedan como NaN).
+
+    Retorna:
+        tuple: (matriz, {columna: lista de categorías}) de las columnas codificadas.
+    """
+    matrix = np.empty((len(X), X.shape[1]), dtype=feature_dtype)
+    categories = {}
+    for i, col in enumerate(X.columns):
+        values = X[col]
+        if not pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            values = values.astype("category")
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories[col] = [str(category) for category in values.cat.categories]
+            codes = values.cat.codes.to_numpy()
+            matrix[:, i] = np.where(codes < 0, np.nan, codes)
+        else:
+            matrix[:, i] = values.to_numpy(dtype=feature_dtype, na_value=np.nan)
+    return matrix, categories
+
+def _save_array(path, array):
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+def load_feature_matrix(key: str, directory: str | None = None):
+    """
+    Abre una matriz guardada con memoria mapeada (solo lectura).
+
+    Retorna:
+        tuple: (X, y, manifest). Lanza FileNotFoundError si la llave no existe.
+    """
+    path = os.path.join(directory or feature_cache_directory, key)
+    with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    X = np.load(os.path.join(path, "X.npy"), mmap_mode="r")
+    y = np.load(os.path.join(path, "y.npy"), mmap_mode="r")
+    return X, y, manifest
+
+def get_feature_matrix(df: pd.DataFrame, drop_cols: list[str] | None = None, target: str = "Value",
+                       directory: str | None = None):
+    """
+    Devuelve X e y de `df` como arreglos con memoria mapeada, generándolos solo
+    si no existen para este dataset y estas columnas.
+
+    Parámetros:
+        df (pd.DataFrame): Dataset de modelado (p. ej. de `load_modeling_dataset`).
+        drop_cols (list[str], opcional): Columnas que no son características.
+        target (str, opcional): Columna objetivo (por defecto "Value").
+        directory (str, opcional): Carpeta de la caché (por defecto FEATURE_CACHE_DIRECTORY).
+
+    Retorna:
+        tuple: (X, y, manifest). `manifest["columns"]` tiene los nombres de las
+        columnas de X en orden y `manifest["categories"]` las categorías de las
+        columnas codificadas.
+    """
+    directory = directory or feature_cache_directory
+    drop = set(drop_cols or []) | {target}
+    feature_columns = [col for col in df.columns if col not in drop]
+    key = feature_key(dataset_fingerprint(df), feature_columns, target)
+    try:
+        return load_feature_matrix(key, directory)
+    except FileNotFoundError:
+        pass
+
+    logging.info("Generando la matriz de características %s", key)
+    matrix, categories = encode_features(df[feature_columns])
+    manifest = {
+        "key": key,
+        "rows": int(matrix.shape[0]),
+        "columns": feature_columns,
+        "categories": categories,
+        "target": target,
+        "dtype": np.dtype(feature_dtype).name,
+    }
+    path = os.path.join(directory, key)
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    _save_array(os.path.join(tmp_path, "X.npy"), matrix)
+    _save_array(os.path.join(tmp_path, "y.npy"), df[target].to_numpy(dtype=np.float64))
+    with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    # Otro proceso pudo generar la misma llave mientras tanto
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return load_feature_matrix(key, directory)
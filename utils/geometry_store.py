@@ -0,0 +1,116 @@
+import os
+import glob
+import hashlib
+import logging
+import geopandas as gpd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+#################################################
+#####Almacén de geometrías (GeoParquet)##########
+#################################################
+# Los shapefiles de shape_files/ se convierten una sola vez a GeoParquet con
+# las geometrías ya proyectadas y los centroides calculados:
+#   geometry          EPSG:4326 (geometría activa)
+#   geometry_5070     EPSG:5070 (Albers, metros)
+#   centroid_x/_y     centroide en EPSG:5070
+#   lat/lon_centroid  centroide en EPSG:4326
+# Cada capa se lee del disco la primera vez que se usa y queda en memoria; el
+# índice espacial (`gdf.sindex`, un STRtree) también se construye al primer uso
+# y se conserva con la capa. Si el shapefile es más reciente que el GeoParquet,
+# la capa se regenera.
+
+geometry_store_directory = os.environ.get("GEOMETRY_STORE_DIRECTORY", ".cache/geometry")
+projected_epsg = 5070
+geographic_epsg = 4326
+
+layer_sources = {
+    "counties": "shape_files/country/cb_2018_us_county_500k.shp",
+    "states": "shape_files/state/cb_2018_us_state_20m.shp",
+    # Estados a 1:500k (GeoJSON en línea) para los mapas de estaciones; se descarga
+    # una sola vez al generar la capa
+    "states_500k": "https://eric.clst.org/assets/wiki/uploads/Stuff/gz_2010_us_040_00_500k.json",
+    "voronoi": "shape_files/voronoi/counties_voronoi_station.shp",
+}
+
+_layers = {}
+
+
+def layer_path(name: str) -> str:
+    return os.path.join(geometry_store_directory, f"{name}.parquet")
+
+def build_layer(name: str) -> str:
+    """
+    Convierte el shapefile de la capa `name` a GeoParquet.
+
+    Retorna:
+        str: Ruta del archivo escrito.
+    """
+    source = layer_sources[name]
+    logging.info("Convirtiendo %s a GeoParquet", source)
+    gdf = gpd.read_file(source)
+    projected = gdf.to_crs(epsg=projected_epsg)
+    centroids = projected.geometry.centroid
+    wgs84 = projected.to_crs(epsg=geographic_epsg)
+    # Mismo cálculo que get_counties_centroids: centroide de la geometría en EPSG:4326
+    centroids_wgs84 = wgs84.geometry.centroid
+    wgs84["geometry_5070"] = projected.geometry
+    wgs84["centroid_x"] = centroids.x
+    wgs84["centroid_y"] = centroids.y
+    wgs84["lat_centroid"] = centroids_wgs84.y
+    wgs84["lon_centroid"] = centroids_wgs84.x
+
+    os.makedirs(geometry_store_directory, exist_ok=True)
+    path = layer_path(name)
+    tmp_path = f"{path}.tmp"
+    wgs84.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+def layer_fingerprint(name: str) -> str:
+    """
+    Hash del contenido de los archivos del shapefile de la capa `name`. Sirve
+    como llave de cachés que dependen de la capa sin tener que leerla.
+    """
+    base, _ = os.path.splitext(layer_sources[name])
+    digest = hashlib.sha256(name.encode("utf-8"))
+    for path in sorted(glob.glob(f"{glob.escape(base)}.*")):
+        digest.update(os.path.basename(path).encode("utf-8"))
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def _is_stale(name):
+    path, source = layer_path(name), layer_sources[name]
+    if not os.path.exists(path):
+        return True
+    return os.path.exists(source) and os.path.getmtime(source) > os.path.getmtime(path)
+
+def load_layer(name: str) -> gpd.GeoDataFrame:
+    """
+    Capa `name` ("counties", "states", "voronoi") como GeoDataFrame en EPSG:4326,
+    con `geometry_5070` y los centroides precalculados. La primera llamada la
+    lee (o la genera); las siguientes devuelven la misma capa en memoria, que
+    no se debe modificar (usar `.copy()` o filtrar).
+    """
+    layer = _layers.get(name)
+    if layer is None:
+        if _is_stale(name):
+            build_layer(name)
+        layer = _layers[name] = gpd.read_parquet(layer_path(name))
+    return layer
+
+def to_projected(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """La misma capa con `geometry_5070` como geometría activa (columna "geometry")."""
+    return gdf.set_geometry("geometry_5070").drop(columns=["geometry"]).rename_geometry("geometry")
+
+def projected_centroids(gdf) -> gpd.GeoSeries:
+    """Centroides precalculados en EPSG:5070 como puntos."""
+    return gpd.GeoSeries(gpd.points_from_xy(gdf["centroid_x"], gdf["centroid_y"]), index=gdf.index,
+                         crs=f"EPSG:{projected_epsg}")
+
+def clear() -> None:
+    """Libera las capas cargadas en memoria."""
+    _layers.clear()
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import requests
+from urllib.parse import urlsplit, urlunsplit, parse_qsl
+from dotenv import load_dotenv
+
+try:
+    import orjson  # decodificador JSON en C, mucho más rápido con las respuestas grandes de AWDB
+except ImportError:
+    orjson = None
+
+load_dotenv()
+
+#################################################
+#####Caché en disco de respuestas HTTP###########
+#################################################
+# Cada respuesta JSON se guarda en un archivo cuyo nombre es el hash del
+# endpoint + parámetros normalizados. Las respuestas históricas no cambian,
+# así que volver a ejecutar el pipeline no necesita repetir las consultas.
+# Las consultas pasan por `utils.http_client.get_json`, que usa esta caché.
+
+cache_directory = os.environ.get("HTTP_CACHE_DIRECTORY", ".cache/http")
+max_cache_bytes = int(os.environ.get("HTTP_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+# Tiempo de vida (segundos) por fuente. None = nunca expira.
+# Se puede sobrescribir con HTTP_CACHE_TTL_<FUENTE>, p. ej. HTTP_CACHE_TTL_NASA_POWER=0
+source_ttls = {
+    "awdb": 7 * 24 * 3600,          # listado de estaciones
+    "awdb_data": 24 * 3600,         # /data incluye el mes en curso, que la carga incremental vuelve a pedir
+    "nasa_power": 30 * 24 * 3600,   # POWER reprocesa los meses recientes
+    "soilgrids": None,              # propiedades de suelo estáticas
+    "quick_stats": 30 * 24 * 3600,
+}
+
+# Parámetros que no forman parte de la llave ni se guardan (credenciales)
+excluded_params = {"key", "api_key"}
+
+_lock = threading.Lock()
+_cache_size = None
+
+
+class OfflineCacheMiss(requests.exceptions.RequestException):
+    """La respuesta no está en caché y el modo sin conexión está activo."""
+
+
+def loads_json(data: bytes):
+    """Decodifica JSON desde bytes con orjson si está instalado, si no con json."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def is_offline() -> bool:
+    """Modo solo caché: HTTP_CACHE_OFFLINE=1 evita cualquier llamada de red."""
+    return os.environ.get("HTTP_CACHE_OFFLINE", "0").lower() in {"1", "true", "yes"}
+
+def is_enabled() -> bool:
+    return os.environ.get("HTTP_CACHE_ENABLED", "1").lower() not in {"0", "false", "no"}
+
+def get_ttl(source: str) -> float | None:
+    override = os.environ.get(f"HTTP_CACHE_TTL_{source.upper()}")
+    if override is not None:
+        return float(override) if override.lower() != "none" else None
+    return source_ttls.get(source)
+
+def normalize_request(url: str, params: dict | None = None) -> tuple[str, list[tuple[str, str]]]:
+    """
+    Devuelve (endpoint, parámetros) en forma canónica: los parámetros de la URL y
+    de `params` se unen, las listas se expanden como hace requests y todo se ordena.
+    """
+    parts = urlsplit(url)
+    endpoint = urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, "", ""))
+    items = parse_qsl(parts.query, keep_blank_values=True)
+    for name, value in (params or {}).items():
+        if value is None:
+            continue
+        values = value if isinstance(value, (list, tuple)) else [value]
+        items.extend((name, str(v)) for v in values)
+    items = sorted((name, str(value)) for name, value in items if name not in excluded_params)
+    return endpoint, items
+
+def cache_key(url: str, params: dict | None = None) -> str:
+    endpoint, items = normalize_request(url, params)
+    raw = json.dumps([endpoint, items], separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _cache_path(source: str, key: str) -> str:
+    return os.path.join(cache_directory, source, key[:2], f"{key}.json")
+
+def read_cached_response(source: str, url: str, params: dict | None = None):
+    """Devuelve el JSON guardado para la consulta o None si no existe o expiró."""
+    if not is_enabled():
+        return None
+    path = _cache_path(source, cache_key(url, params))
+    try:
+        with open(path, "rb") as f:
+            entry = loads_json(f.read())
+    except (OSError, ValueError):
+        return None
+
+    ttl = get_ttl(source)
+    if ttl is not None and time.time() - entry.get("created", 0) > ttl and not is_offline():
+        return None
+
+    # LRU: la fecha de modificación marca el último uso
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return entry["payload"]
+
+def write_cached_response(source: str, url: str, params: dict | None, payload) -> None:
+    if not is_enabled():
+        return
+    endpoint, items = normalize_request(url, params)
+    path = _cache_path(source, cache_key(url, params))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    entry = {"endpoint": endpoint, "params": items, "created": time.time(), "payload": payload}
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+    old_size = os.path.getsize(path) if os.path.exists(path) else 0
+    os.replace(tmp_path, path)
+    _register_write(os.path.getsize(path) - old_size)
+
+def _scan_cache():
+    files = []
+    for root, _, names in os.walk(cache_directory):
+        for name in names:
+            if name.endswith(".json"):
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+    return files
+
+def _register_write(delta: int) -> None:
+    global _cache_size
+    with _lock:
+        if _cache_size is None:
+            _cache_size = sum(size for _, size, _ in _scan_cache())
+        else:
+            _cache_size += delta
+        if _cache_size > max_cache_bytes:
+            _cache_size = _evict(max_cache_bytes)
+
+def _evict(limit: int) -> int:
+    """Elimina las entradas usadas hace más tiempo hasta quedar bajo el 90% del límite."""
+    files = sorted(_scan_cache())
+    total = sum(size for _, size, _ in files)
+    target = int(limit * 0.9)
+    for _, size, path in files:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            continue
+    logging.info("Caché HTTP reducida a %.1f MB", total / 1024 ** 2)
+    return total
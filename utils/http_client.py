@@ -0,0 +1,208 @@
+import os
+import time
+import random
+import logging
+import threading
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from utils.http_cache import read_cached_response, write_cached_response, is_enabled, is_offline, loads_json, OfflineCacheMiss
+from utils.rate_limiter import parse_retry_after
+from utils import telemetry
+
+load_dotenv()
+
+#################################################
+#####Cliente HTTP compartido#####################
+#################################################
+# Todas las consultas de data/ pasan por aquí:
+#   - una sola sesión con pool de conexiones (keep-alive, sin repetir TLS)
+#   - reintentos con backoff exponencial y jitter
+#   - circuit breaker por host
+#   - límite de consultas simultáneas por host
+#   - métricas por endpoint (utils.telemetry)
+
+# Consultas simultáneas máximas por host
+host_max_concurrency = {
+    "wcc.sc.egov.usda.gov": 8,        # AWDB
+    "power.larc.nasa.gov": 4,         # NASA POWER
+    "rest.isric.org": 2,              # SoilGrids (además del limitador de tasa)
+    "quickstats.nass.usda.gov": 8,    # Quick Stats
+}
+default_max_concurrency = int(os.environ.get("HTTP_MAX_CONCURRENCY_PER_HOST", 8))
+
+# Circuit breaker: tras N fallos seguidos el host se da por caído durante `reset_timeout` segundos
+breaker_failure_threshold = int(os.environ.get("HTTP_BREAKER_FAILURES", 5))
+breaker_reset_timeout = float(os.environ.get("HTTP_BREAKER_RESET_SECONDS", 60))
+
+retry_statuses = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """El host acumuló demasiados fallos seguidos y no se consulta temporalmente."""
+
+
+class _CircuitBreaker:
+    def __init__(self, host):
+        self.host = host
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.time() - self.opened_at < breaker_reset_timeout:
+                raise CircuitOpenError(f"Circuito abierto para {self.host} tras {self.failures} fallos")
+            if self.probing:
+                raise CircuitOpenError(f"Circuito semiabierto para {self.host}: consulta de prueba en curso")
+            # Semiabierto: pasa una sola consulta de prueba; las demás se rechazan hasta que termine
+            self.probing = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing:
+                # La consulta de prueba falló: el circuito se vuelve a abrir
+                logging.warning("Reabriendo circuito para %s (falló la consulta de prueba)", self.host)
+                self.probing = False
+                self.opened_at = time.time()
+            elif self.failures >= breaker_failure_threshold and self.opened_at is None:
+                logging.warning("Abriendo circuito para %s (%d fallos seguidos)", self.host, self.failures)
+                self.opened_at = time.time()
+
+    def release_probe(self):
+        """La consulta terminó sin indicar si el host se recuperó (p. ej. 429): se permite otra prueba."""
+        with self._lock:
+            self.probing = False
+
+
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
+_breakers = {}
+_semaphores = {}
+_registry_lock = threading.Lock()
+
+
+def _host_state(host):
+    with _registry_lock:
+        if host not in _breakers:
+            _breakers[host] = _CircuitBreaker(host)
+            _semaphores[host] = threading.BoundedSemaphore(host_max_concurrency.get(host, default_max_concurrency))
+        return _breakers[host], _semaphores[host]
+
+def backoff_delay(attempt: int, base: float = 1.0, maximum: float = 60.0) -> float:
+    """Backoff exponencial con jitter completo: uniforme en [0, min(maximum, base * 2**attempt)]."""
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+def _endpoint(url):
+    """Host + ruta, sin parámetros: la etiqueta de las métricas."""
+    parts = urlsplit(url)
+    return f"{parts.netloc.lower()}{parts.path}"
+
+def request(method, url, params=None, timeout=30, max_retries=3, backoff=1.0, rate_limiter=None, **kwargs):
+    """
+    Ejecuta una consulta con la sesión compartida.
+
+    Los errores de conexión, timeouts y estados de `retry_statuses` se reintentan
+    hasta `max_retries` veces; si el último intento sigue fallando se devuelve la
+    respuesta (o se lanza la excepción) para que quien llama decida. Con
+    `rate_limiter` (ver `utils.rate_limiter`) cada intento espera un token y los
+    429 ajustan la tasa compartida.
+    """
+    host = urlsplit(url).netloc.lower()
+    endpoint = _endpoint(url)
+    breaker, semaphore = _host_state(host)
+
+    for attempt in range(max_retries + 1):
+        last_attempt = attempt == max_retries
+        breaker.before_request()
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+
+        try:
+            with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = _session.request(method, url, params=params, timeout=timeout, **kwargs)
+                except requests.exceptions.RequestException:
+                    telemetry.record_request(endpoint, time.perf_counter() - started, retry=attempt > 0)
+                    raise
+                telemetry.record_request(endpoint, time.perf_counter() - started, response.status_code,
+                                         len(response.content), retry=attempt > 0)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            breaker.record_failure()
+            if last_attempt:
+                raise
+            delay = backoff_delay(attempt, backoff)
+            logging.info("Error de conexión con %s (%s), reintento en %.1f s", host, e, delay)
+            time.sleep(delay)
+            continue
+        except requests.exceptions.RequestException:
+            breaker.release_probe()
+            raise
+
+        if response.status_code in retry_statuses:
+            retry_after = response.headers.get("Retry-After")
+            if response.status_code == 429:
+                # Un 429 no dice si el host se recuperó: no cuenta como fallo ni como éxito
+                breaker.release_probe()
+            if response.status_code == 429 and rate_limiter is not None:
+                # El limitador pausa a todos los clientes; no hace falta esperar aquí
+                rate_limiter.on_throttle(retry_after)
+                delay = 0.0
+            else:
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                delay = parse_retry_after(retry_after)
+                if delay is None:
+                    delay = backoff_delay(attempt, backoff)
+            if last_attempt:
+                return response
+            logging.info("%s respondió %d, reintento %d/%d", host, response.status_code, attempt + 1, max_retries)
+            if delay:
+                time.sleep(delay)
+            continue
+
+        breaker.record_success()
+        if rate_limiter is not None and response.ok:
+            rate_limiter.on_success()
+        return response
+
+def get(url, params=None, **kwargs):
+    return request("GET", url, params=params, **kwargs)
+
+def get_json(source: str, url: str, params: dict | None = None, timeout: float = 30, **kwargs):
+    """
+    GET de un recurso JSON con la caché en disco (`utils.http_cache`): devuelve el
+    JSON guardado si existe; si no, consulta la API, valida el estado HTTP y
+    guarda la respuesta.
+
+    Lanza las excepciones de `requests` (incluida `CircuitOpenError`) y
+    `OfflineCacheMiss` si el modo sin conexión está activo y no hay caché.
+    """
+    payload = read_cached_response(source, url, params)
+    if is_enabled():
+        telemetry.record_cache(_endpoint(url), hit=payload is not None)
+    if payload is not None:
+        return payload
+    if is_offline():
+        raise OfflineCacheMiss(f"Sin caché para {url} (modo sin conexión)")
+
+    response = get(url, params=params, timeout=timeout, **kwargs)
+    response.raise_for_status()
+    payload = loads_json(response.content)
+    write_cached_response(source, url, params, payload)
+    return payload
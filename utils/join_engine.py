@@ -0,0 +1,162 @@
+import os
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+#################################################
+#####Motor de joins de merge_data################
+#################################################
+# engine="pandas": merge en memoria (comportamiento original).
+# engine="duckdb": el mismo join en DuckDB embebido, con hash joins en varios
+# hilos, límite de memoria y volcado a disco (spill) cuando la tabla hash no
+# cabe. Las entradas pueden ser DataFrames o rutas a archivos/datasets Parquet,
+# que DuckDB lee por partes sin cargarlos completos.
+#
+# El resultado es el mismo que el de `pd.merge`: filas en el mismo orden, llaves
+# nulas que coinciden entre sí, sufijos _x/_y para columnas repetidas y los mismos tipos.
+
+merge_engine = os.environ.get("MERGE_ENGINE", "pandas")
+duckdb_memory_limit = os.environ.get("DUCKDB_MEMORY_LIMIT", "2GB")
+duckdb_temp_directory = os.environ.get("DUCKDB_TEMP_DIRECTORY", ".cache/duckdb")
+duckdb_threads = int(os.environ.get("DUCKDB_THREADS", os.cpu_count() or 1))
+
+_row_column = "__row_number"
+_key_order_column = "__key_order"
+
+
+def _connect():
+    import duckdb
+
+    os.makedirs(duckdb_temp_directory, exist_ok=True)
+    con = duckdb.connect(config={
+        "memory_limit": duckdb_memory_limit,
+        "temp_directory": duckdb_temp_directory,
+        "threads": duckdb_threads,
+    })
+    return con
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _register(con, name, source):
+    """Registra `source` como vista `name` con una columna de número de fila. Devuelve sus columnas y tipos."""
+    if isinstance(source, (str, os.PathLike)):
+        path = os.fspath(source)
+        pattern = os.path.join(path, "**", "*.parquet") if os.path.isdir(path) else path
+        literal = "'" + pattern.replace("'", "''") + "'"
+        con.execute(
+            f"CREATE VIEW {name} AS SELECT *, row_number() OVER () AS {_row_column} "
+            f"FROM read_parquet({literal}, hive_partitioning = true)"
+        )
+        # Solo el esquema, sin leer datos
+        dtypes = con.execute(f"SELECT * EXCLUDE ({_row_column}) FROM {name} LIMIT 0").df().dtypes
+        return dtypes
+    con.register(f"{name}_df", source)
+    con.execute(f"CREATE VIEW {name} AS SELECT *, row_number() OVER () AS {_row_column} FROM {name}_df")
+    return source.dtypes
+
+def _merged_dtype(left_dtype, right_dtype):
+    # pd.merge conserva la categoría de una llave solo si ambas tienen las mismas categorías
+    if isinstance(left_dtype, pd.CategoricalDtype):
+        return left_dtype if left_dtype == right_dtype else object
+    return left_dtype
+
+def merge_duckdb(left, right, on: list[str], how: str = "inner", columns: list[str] | None = None,
+                 suffixes=("_x", "_y")) -> pd.DataFrame:
+    """
+    Equivalente a `left.merge(right, on=on, how=how, suffixes=suffixes)[columns]`
+    ejecutado en DuckDB.
+
+    Parámetros:
+        left, right (pd.DataFrame | str): Tablas o rutas a Parquet (archivo o dataset particionado).
+        on (list[str]): Columnas llave.
+        how (str, opcional): "inner" o "left".
+        columns (list[str], opcional): Columnas del resultado; se seleccionan dentro de
+            DuckDB, de modo que las demás nunca se materializan en pandas.
+    """
+    if how not in {"inner", "left"}:
+        raise ValueError(f"how={how!r} no soportado por el motor duckdb")
+    on = [on] if isinstance(on, str) else list(on)
+
+    con = _connect()
+    try:
+        left_dtypes = _register(con, "left_table", left)
+        right_dtypes = _register(con, "right_table", right)
+
+        # Mismos nombres y orden de columnas que pd.merge
+        overlap = (set(left_dtypes.index) & set(right_dtypes.index)) - set(on)
+        select, output_dtypes = [], {}
+        for col in left_dtypes.index:
+            out = f"{col}{suffixes[0]}" if col in overlap else col
+            select.append(f"l.{_quote(col)} AS {_quote(out)}")
+            output_dtypes[out] = _merged_dtype(left_dtypes[col], right_dtypes[col]) if col in on else left_dtypes[col]
+        for col in right_dtypes.index:
+            if col in on:
+                continue
+            out = f"{col}{suffixes[1]}" if col in overlap else col
+            select.append(f"r.{_quote(col)} AS {_quote(out)}")
+            output_dtypes[out] = right_dtypes[col]
+        if columns is not None:
+            wanted = set(columns)
+            select = [s for s, out in zip(select, output_dtypes) if out in wanted]
+            output_dtypes = {out: output_dtypes[out] for out in columns}
+
+        # IS NOT DISTINCT FROM: las llaves nulas coinciden entre sí, como en pandas
+        condition = " AND ".join(f"l.{_quote(col)} IS NOT DISTINCT FROM r.{_quote(col)}" for col in on)
+        if how == "inner":
+            # pd.merge(how="inner") agrupa las filas por llave en el orden en que
+            # cada llave aparece por primera vez en la tabla izquierda
+            partition = ", ".join(_quote(col) for col in on)
+            left_view = (f"(SELECT *, min({_row_column}) OVER (PARTITION BY {partition}) AS {_key_order_column} "
+                         f"FROM left_table)")
+            order = f"l.{_key_order_column}, l.{_row_column}, r.{_row_column}"
+            join = "JOIN"
+        else:
+            left_view = "left_table"
+            order = f"l.{_row_column}, r.{_row_column}"
+            join = "LEFT JOIN"
+        query = (
+            f"SELECT {', '.join(select)} FROM {left_view} l {join} right_table r ON {condition} "
+            f"ORDER BY {order}"
+        )
+        result = con.execute(query).df()
+    finally:
+        con.close()
+
+    if columns is not None:
+        result = result[list(columns)]
+    # Restituir los tipos de pandas (categorías, enteros pequeños, float32)
+    for col, dtype in output_dtypes.items():
+        if how == "left" and result[col].isna().any():
+            if pd.api.types.is_integer_dtype(dtype):
+                # Igual que pandas: los enteros sin coincidencia pasan a float64
+                dtype = "float64"
+            elif dtype == object:
+                # DuckDB devuelve None donde pandas deja NaN
+                result[col] = result[col].where(result[col].notna(), np.nan)
+        if result[col].dtype == dtype:
+            continue
+        try:
+            result[col] = result[col].astype(dtype)
+        except (TypeError, ValueError):
+            continue
+    return result
+
+def merge(left, right, on: list[str], how: str = "inner", engine: str | None = None,
+          columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Merge con el motor indicado (por defecto `merge_engine`, variable MERGE_ENGINE).
+    """
+    engine = engine or merge_engine
+    if engine == "duckdb":
+        return merge_duckdb(left, right, on=on, how=how, columns=columns)
+    if engine != "pandas":
+        raise ValueError(f"Motor de merge desconocido: {engine}")
+    if isinstance(left, (str, os.PathLike)):
+        left = pd.read_parquet(left)
+    if isinstance(right, (str, os.PathLike)):
+        right = pd.read_parquet(right)
+    result = left.merge(right, how=how, on=on)
+    return result[list(columns)] if columns is not None else result
@@ -0,0 +1,102 @@
+import os
+import json
+import logging
+import threading
+import numpy as np
+
+#################################################
+#####Diario de ingesta reanudable################
+#################################################
+# Archivo JSONL de solo escritura al final: cada línea es una unidad terminada
+# (estación, ubicación, ...) con su resultado. Si la ingesta se interrumpe, al
+# reiniciar se leen las unidades terminadas y solo se consultan las pendientes.
+
+
+def _to_json(value):
+    # Tipos de numpy/pandas que json no sabe serializar
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+class IngestionJournal:
+    """
+    Diario de unidades terminadas.
+
+    journal = IngestionJournal("source_data/journal/scan_stations.jsonl")
+    completed = journal.completed()          # {key: record}
+    journal.append(key, record)              # tras cada unidad
+    journal.clear()                          # cuando el resultado final ya está guardado
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._checked_tail = False
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def completed(self) -> dict:
+        """Devuelve {key: record} de las unidades terminadas (la última escritura gana)."""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Línea cortada por una interrupción a mitad de escritura
+                    logging.warning("Línea %d incompleta en %s, se ignora", line_number, self.path)
+                    continue
+                records[entry["key"]] = entry["record"]
+        if records:
+            logging.info("Diario %s: %d unidades ya terminadas", self.path, len(records))
+        return records
+
+    def _truncate_partial_tail(self) -> None:
+        """
+        Si una interrupción dejó la última línea a medias (sin salto de línea),
+        la recorta para que la siguiente escritura no se pegue a ella.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - 4096)
+                f.seek(start)
+                chunk = f.read(position - start)
+                newline = chunk.rfind(b"\n")
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position < end:
+                logging.warning("Recortando %d bytes de una línea incompleta al final de %s", end - position, self.path)
+                f.truncate(position)
+
+    def append(self, key, record) -> None:
+        line = json.dumps({"key": key, "record": record}, default=_to_json)
+        with self._lock:
+            if not self._checked_tail:
+                self._truncate_partial_tail()
+                self._checked_tail = True
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def clear(self) -> None:
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
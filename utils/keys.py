@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from utils.states_codes import state_alpha_to_fips
+from utils.storage import save_dataframe, read_dataframe, dataset_exists
+
+load_dotenv()
+
+#################################################
+#####Llaves enteras de estaciones y condados#####
+#################################################
+# Los joins entre etapas se hacen sobre dos llaves enteras en lugar de
+# latitud/longitud (float) o códigos FIPS en texto:
+#   - county_fips: FIPS de 5 dígitos como entero (estado * 1000 + condado), p. ej. 19153
+#   - station_key: índice de la estación, asignado una sola vez al ingerirla y
+#     guardado en el registro `station_keys` para que no cambie entre ejecuciones
+# Solo la ingesta escribe el registro (`register_station_keys`). Los merges y el
+# resto del análisis lo leen con `add_station_key`, que falla si falta una llave.
+
+station_registry_name = "station_keys"
+key_dtype = "int32"
+
+
+def county_fips(state_fips, county_code) -> pd.Series:
+    """
+    FIPS de condado de 5 dígitos como entero a partir de los códigos de estado y
+    condado (texto con o sin ceros, o números). Los nulos se devuelven como <NA>.
+    """
+    state = pd.to_numeric(pd.Series(state_fips).astype("string"), errors="coerce")
+    county = pd.to_numeric(pd.Series(county_code).astype("string"), errors="coerce")
+    return (state * 1000 + county).astype("Int32")
+
+def add_county_fips(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Agrega la columna `county_fips` si no existe. Usa, en este orden, GEOID
+    (shapefile de condados), STATEFP/COUNTYFP, state_fips_code/county_code
+    (Quick Stats) o state_alpha/county_code.
+    """
+    if "county_fips" in df.columns:
+        return df
+    df = df.copy()
+    if "GEOID" in df.columns:
+        df["county_fips"] = pd.to_numeric(df["GEOID"].astype("string"), errors="coerce").astype("Int32")
+    elif {"STATEFP", "COUNTYFP"}.issubset(df.columns):
+        df["county_fips"] = county_fips(df["STATEFP"], df["COUNTYFP"]).to_numpy()
+    elif {"state_fips_code", "county_code"}.issubset(df.columns):
+        df["county_fips"] = county_fips(df["state_fips_code"], df["county_code"]).to_numpy()
+    elif {"state_alpha", "county_code"}.issubset(df.columns):
+        state = df["state_alpha"].astype("string").map(state_alpha_to_fips)
+        df["county_fips"] = county_fips(state, df["county_code"]).to_numpy()
+    else:
+        raise KeyError("No hay columnas para construir county_fips")
+    if df["county_fips"].notna().all():
+        df["county_fips"] = df["county_fips"].astype(key_dtype)
+    return df
+
+def read_station_registry(directory: str | None = None) -> pd.DataFrame:
+    if not dataset_exists(station_registry_name, directory):
+        return pd.DataFrame({"stationTriplet": pd.Series(dtype="object"), "station_key": pd.Series(dtype=key_dtype)})
+    return read_dataframe(station_registry_name, directory=directory)
+
+def assign_station_keys(triplets, directory: str | None = None) -> pd.Series:
+    """
+    Devuelve el `station_key` de cada `stationTriplet`. Las estaciones nuevas
+    reciben el siguiente entero libre y se agregan al registro. Solo se usa al
+    ingerir estaciones (`register_station_keys`); el resto del código consulta
+    el registro con `station_keys`.
+    """
+    triplets = pd.Series(triplets).astype("string")
+    registry = read_station_registry(directory)
+    mapping = dict(zip(registry["stationTriplet"].astype("string"), registry["station_key"].astype(int)))
+
+    new_triplets = [t for t in pd.unique(triplets.dropna()) if t not in mapping]
+    if new_triplets:
+        next_key = max(mapping.values(), default=-1) + 1
+        for offset, triplet in enumerate(new_triplets):
+            mapping[triplet] = next_key + offset
+        registry = pd.DataFrame({"stationTriplet": list(mapping), "station_key": np.fromiter(mapping.values(), dtype=key_dtype)})
+        save_dataframe(registry, station_registry_name, directory=directory)
+
+    keys = triplets.map(mapping)
+    return keys.astype(key_dtype) if keys.notna().all() else keys.astype("Int32")
+
+def station_keys(triplets, directory: str | None = None) -> pd.Series:
+    """
+    `station_key` de cada `stationTriplet` según el registro, sin modificarlo.
+    Lanza KeyError si alguna estación no fue ingerida (no está en el registro).
+    """
+    triplets = pd.Series(triplets).astype("string")
+    registry = read_station_registry(directory)
+    mapping = dict(zip(registry["stationTriplet"].astype("string"), registry["station_key"].astype(int)))
+    keys = triplets.map(mapping)
+    missing = pd.unique(triplets[keys.isna() & triplets.notna()])
+    if len(missing):
+        raise KeyError(f"Estaciones sin station_key en {station_registry_name}: {list(missing[:10])}")
+    return keys.astype(key_dtype) if keys.notna().all() else keys.astype("Int32")
+
+def _with_station_key(df, lookup, directory):
+    if "station_key" in df.columns and df["station_key"].notna().all():
+        return df
+    df = df.copy()
+    df["station_key"] = lookup(df["stationTriplet"], directory).to_numpy()
+    return df
+
+def register_station_keys(df: pd.DataFrame, directory: str | None = None) -> pd.DataFrame:
+    """
+    Ingesta: agrega `station_key` (a partir de stationTriplet) si no existe o si le
+    faltan valores, y registra las estaciones nuevas en `station_keys`.
+    """
+    return _with_station_key(df, assign_station_keys, directory)
+
+def add_station_key(df: pd.DataFrame, directory: str | None = None) -> pd.DataFrame:
+    """
+    Agrega la columna `station_key` si no existe o si le faltan valores, leyendo
+    el registro sin modificarlo. Lanza KeyError si hay estaciones sin llave.
+    """
+    return _with_station_key(df, station_keys, directory)
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import threading
+from email.utils import parsedate_to_datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+#################################################
+#####Limitador de tasa compartido (AIMD)#########
+#################################################
+# Token bucket cuyo estado vive en un archivo JSON protegido por un archivo de
+# bloqueo, de modo que todos los hilos y procesos que consultan la misma API
+# comparten la cuota. La tasa sube de forma aditiva con cada respuesta correcta
+# y baja a la mitad con cada 429, respetando el encabezado Retry-After.
+
+rate_limit_directory = os.environ.get("RATE_LIMIT_DIRECTORY", ".cache/rate_limits")
+
+# Configuración por API (tasas en llamadas por segundo)
+limiter_settings = {
+    # SoilGrids publica un uso justo de ~5 llamadas por minuto
+    "soilgrids": {
+        "rate": float(os.environ.get("SOILGRID_RATE_PER_MINUTE", 5)) / 60,
+        "min_rate": 1 / 60,
+        "max_rate": float(os.environ.get("SOILGRID_MAX_RATE_PER_MINUTE", 10)) / 60,
+        "increase": 0.25 / 60,
+        "decrease_factor": 0.5,
+        "burst": 1,
+    },
+}
+
+_limiters = {}
+_registry_lock = threading.Lock()
+
+
+def parse_retry_after(value) -> float | None:
+    """Convierte un encabezado Retry-After (segundos o fecha HTTP) en segundos de espera."""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _FileLock:
+    """Bloqueo entre procesos basado en la creación exclusiva de un archivo."""
+
+    def __init__(self, path, stale_after=30):
+        self.path = path
+        self.stale_after = stale_after
+
+    def __enter__(self):
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return self
+            except FileExistsError:
+                # Un proceso que murió con el bloqueo tomado no debe bloquear a los demás
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.stale_after:
+                        os.remove(self.path)
+                        continue
+                except OSError:
+                    continue
+                time.sleep(0.01)
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class RateLimiter:
+    """
+    Token bucket adaptativo compartido entre procesos.
+
+    Uso:
+        limiter.acquire()            # antes de cada llamada
+        limiter.on_success()         # respuesta correcta
+        limiter.on_throttle(retry)   # respuesta 429
+    """
+
+    def __init__(self, name, rate, min_rate, max_rate, increase, decrease_factor=0.5, burst=1):
+        self.name = name
+        self.initial_rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.burst = burst
+        os.makedirs(rate_limit_directory, exist_ok=True)
+        self.state_path = os.path.join(rate_limit_directory, f"{name}.json")
+        self._thread_lock = threading.Lock()
+        self._file_lock = _FileLock(os.path.join(rate_limit_directory, f"{name}.lock"))
+
+    def _load(self, now):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {"rate": self.initial_rate, "tokens": self.burst, "updated": now, "blocked_until": 0.0}
+        # Rellenar el bucket según el tiempo transcurrido
+        elapsed = max(0.0, now - state["updated"])
+        state["tokens"] = min(self.burst, state["tokens"] + elapsed * state["rate"])
+        state["updated"] = now
+        return state
+
+    def _save(self, state):
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _update(self, func):
+        with self._thread_lock, self._file_lock:
+            now = time.time()
+            state = self._load(now)
+            result = func(state, now)
+            self._save(state)
+            return result
+
+    def acquire(self) -> float:
+        """Bloquea hasta que haya un token disponible. Devuelve el tiempo esperado."""
+        waited = 0.0
+        while True:
+            def take(state, now):
+                if now < state["blocked_until"]:
+                    return state["blocked_until"] - now
+                if state["tokens"] >= 1:
+                    state["tokens"] -= 1
+                    return 0.0
+                return (1 - state["tokens"]) / state["rate"]
+
+            wait = self._update(take)
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def on_success(self) -> None:
+        def increase(state, now):
+            state["rate"] = min(self.max_rate, state["rate"] + self.increase)
+        self._update(increase)
+
+    def on_throttle(self, retry_after=None) -> None:
+        """Reduce la tasa a la mitad y pausa a todos los clientes durante Retry-After."""
+        delay = parse_retry_after(retry_after)
+
+        def decrease(state, now):
+            state["rate"] = max(self.min_rate, state["rate"] * self.decrease_factor)
+            state["tokens"] = 0.0
+            pause = delay if delay is not None else 1 / state["rate"]
+            state["blocked_until"] = max(state["blocked_until"], now + pause)
+        self._update(decrease)
+
+    @property
+    def rate(self) -> float:
+        return self._update(lambda state, now: state["rate"])
+
+
+def get_rate_limiter(name: str) -> RateLimiter:
+    """Devuelve el limitador compartido de una API definida en `limiter_settings`."""
+    with _registry_lock:
+        if name not in _limiters:
+            _limiters[name] = RateLimiter(name, **limiter_settings[name])
+        return _limiters[name]
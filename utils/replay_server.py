@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+import requests
+from collections import Counter
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dotenv import load_dotenv
+from utils.http_cache import cache_key, normalize_request
+from utils import http_client
+
+load_dotenv()
+
+#################################################
+#####Servidor local de respuestas grabadas#######
+#################################################
+# Sustituye a AWDB, NASA POWER, SoilGrids y Quick Stats durante pruebas y
+# benchmarks: las variables de entorno de cada API se apuntan a este servidor,
+# que devuelve respuestas grabadas (con latencia, 429 y errores inyectados).
+#
+# Cada fuente tiene su propio puerto y conserva la ruta original, p. ej.
+#   USDA_API_URL = http://127.0.0.1:8765/awdb/awdbRestApi/services/v1  (AWDB)
+#   NASA_API_URL = http://127.0.0.1:8766/api/temporal/monthly/point?    (NASA POWER)
+# Como `utils.http_client` lleva el circuit breaker y el límite de consultas
+# simultáneas por host, un puerto por fuente mantiene separados esos estados
+# igual que en producción (los fallos inyectados en una fuente no afectan a las
+# demás), y cada puerto recibe el límite de concurrencia del host real.
+# En modo "record" las consultas se reenvían a la API real y se graban.
+
+recordings_directory = os.environ.get("REPLAY_RECORDINGS_DIRECTORY", ".cache/replay")
+
+# Variable de entorno -> fuente (mismos nombres que usa utils.http_cache)
+source_env_vars = {
+    "USDA_API_URL": "awdb",
+    "NASA_API_URL": "nasa_power",
+    "SOILGRID_API_URL": "soilgrids",
+    "USDA_QUICK_STATS_URL": "quick_stats",
+    "USDA_QUICK_STATS_COUNTS_URL": "quick_stats",
+}
+
+# URLs reales cuando la variable de entorno no está definida
+default_upstreams = {
+    "NASA_API_URL": "https://power.larc.nasa.gov/api/temporal/monthly/point?",
+    "SOILGRID_API_URL": "https://rest.isric.org/soilgrids/v2.0/properties/query",
+}
+
+
+def _recording_path(directory, source, key):
+    return os.path.join(directory, source, f"{key}.json")
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    server_version = "ReplayServer/1.0"
+
+    def do_GET(self):
+        replay = self.server.replay
+        source = self.server.source
+        upstream_url = f"{replay.upstream_origins[source]}{self.path}"
+
+        fault = replay.next_fault(source)
+        if fault["latency"]:
+            time.sleep(fault["latency"])
+        if fault["status"] == 429:
+            replay.count(source, 429)
+            self._send(429, json.dumps({"error": "Too Many Requests"}), {"Retry-After": str(fault["retry_after"])})
+            return
+        if fault["status"]:
+            replay.count(source, fault["status"])
+            self._send(fault["status"], json.dumps({"error": "Error inyectado"}))
+            return
+
+        recording = replay.load(source, upstream_url)
+        if recording is None and replay.mode == "record":
+            recording = replay.record(source, upstream_url)
+        if recording is None:
+            replay.count(source, 404)
+            self._send(404, json.dumps({"error": f"Sin grabación para {upstream_url}"}))
+            return
+        replay.count(source, recording["status"])
+        self._send(recording["status"], recording["body"], {"Content-Type": recording["content_type"]})
+
+    def _send(self, status, body, headers=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        headers = {"Content-Type": "application/json", **(headers or {})}
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug("replay %s - %s", self.address_string(), format % args)
+
+
+class ReplayServer:
+    """
+    Servidor HTTP local que reproduce respuestas grabadas de las APIs de `data/`.
+
+    Parámetros:
+        directory (str, opcional): Carpeta de las grabaciones (por defecto `recordings_directory`).
+        mode (str, opcional): "replay" solo sirve grabaciones; "record" reenvía a la API real
+            las consultas sin grabación y las guarda.
+        latency (float | tuple, opcional): Segundos de espera por consulta, fijo o rango (mín, máx).
+        throttle_rate (float, opcional): Probabilidad de responder 429.
+        error_rate (float, opcional): Probabilidad de responder `error_status`.
+        error_status (int, opcional): Estado de los errores inyectados (por defecto 503).
+        retry_after (float, opcional): Valor del encabezado Retry-After de los 429.
+        faults (dict, opcional): Ajustes por fuente que sobrescriben los anteriores,
+            p. ej. {"soilgrids": {"throttle_rate": 0.3}}.
+        seed (int, opcional): Semilla para que los fallos inyectados sean reproducibles.
+        port (int, opcional): Puerto de la primera fuente; las demás usan los siguientes.
+            Con 0 (por defecto) cada fuente recibe un puerto libre.
+        disable_cache (bool, opcional): Desactiva la caché HTTP en disco mientras el servidor
+            está activo, para que todas las consultas lleguen al servidor.
+
+    Uso (también como fixture de pytest con `yield`):
+        with ReplayServer(latency=(0.05, 0.2), throttle_rate=0.1, seed=0) as server:
+            get_station_data(stations_df, duration="MONTHLY", max_workers=8)
+            print(server.stats)
+    """
+
+    def __init__(self, directory=None, mode="replay", latency=0.0, throttle_rate=0.0, error_rate=0.0,
+                 error_status=503, retry_after=1, faults=None, seed=None, host="127.0.0.1", port=0,
+                 disable_cache=True):
+        if mode not in {"replay", "record"}:
+            raise ValueError(f"Modo no válido: {mode}")
+        self.directory = directory or recordings_directory
+        self.mode = mode
+        self.defaults = {
+            "latency": latency,
+            "throttle_rate": throttle_rate,
+            "error_rate": error_rate,
+            "error_status": error_status,
+            "retry_after": retry_after,
+        }
+        self.faults = faults or {}
+        self.host = host
+        self.port = port
+        self.ports = {}
+        self.disable_cache = disable_cache
+        self.stats = Counter()
+
+        # Origen real (esquema + host) de cada fuente y URL original de cada variable
+        self.upstream_urls = {}
+        self.upstream_origins = {}
+        for env_var, source in source_env_vars.items():
+            url = os.environ.get(env_var) or default_upstreams.get(env_var)
+            if not url:
+                continue
+            parts = urlsplit(url)
+            self.upstream_urls[env_var] = url
+            self.upstream_origins.setdefault(source, f"{parts.scheme}://{parts.netloc}")
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._servers = []
+        self._saved_env = {}
+        self._saved_concurrency = {}
+
+    def source_url(self, source):
+        return f"http://{self.host}:{self.ports[source]}"
+
+    @property
+    def urls(self):
+        """Fuente -> URL local (esquema, host y puerto)."""
+        return {source: self.source_url(source) for source in self.ports}
+
+    def local_url(self, env_var):
+        """URL local equivalente a la de `env_var` (misma ruta, en el puerto de su fuente)."""
+        parts = urlsplit(self.upstream_urls[env_var])
+        url = f"{self.source_url(source_env_vars[env_var])}{parts.path}"
+        if parts.query:
+            url += f"?{parts.query}"
+        elif self.upstream_urls[env_var].endswith("?"):
+            url += "?"
+        return url
+
+    def next_fault(self, source):
+        """Decide la latencia y el fallo (si lo hay) de la siguiente consulta a `source`."""
+        settings = {**self.defaults, **self.faults.get(source, {})}
+        with self._lock:
+            latency = settings["latency"]
+            if isinstance(latency, (tuple, list)):
+                latency = self._random.uniform(*latency)
+            draw = self._random.random()
+        status = None
+        if draw < settings["throttle_rate"]:
+            status = 429
+        elif draw < settings["throttle_rate"] + settings["error_rate"]:
+            status = settings["error_status"]
+        return {"latency": latency, "status": status, "retry_after": settings["retry_after"]}
+
+    def count(self, source, status):
+        with self._lock:
+            self.stats[(source, status)] += 1
+
+    def load(self, source, upstream_url):
+        path = _recording_path(self.directory, source, cache_key(upstream_url))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def record(self, source, upstream_url):
+        """Consulta la API real y guarda la respuesta (sin la llave de la API)."""
+        try:
+            response = requests.get(upstream_url, timeout=60)
+        except requests.exceptions.RequestException as e:
+            logging.warning("No se pudo grabar %s: %s", upstream_url, e)
+            return None
+        recording = {
+            "status": response.status_code,
+            "content_type": response.headers.get("Content-Type", "application/json"),
+            "body": response.text,
+        }
+        # Los 429 y 5xx son transitorios: se devuelven pero no se graban
+        if response.status_code == 429 or response.status_code >= 500:
+            return recording
+        endpoint, params = normalize_request(upstream_url)
+        path = _recording_path(self.directory, source, cache_key(upstream_url))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"endpoint": endpoint, "params": params, **recording}, f)
+        os.replace(tmp_path, path)
+        return recording
+
+    def start(self):
+        for i, (source, origin) in enumerate(self.upstream_origins.items()):
+            httpd = ThreadingHTTPServer((self.host, self.port + i if self.port else 0), _ReplayHandler)
+            httpd.daemon_threads = True
+            httpd.replay = self
+            httpd.source = source
+            self.ports[source] = httpd.server_address[1]
+            thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+            thread.start()
+            self._servers.append((httpd, thread))
+
+            # Mismo límite de consultas simultáneas que el host real
+            local_host = f"{self.host}:{self.ports[source]}"
+            upstream_host = urlsplit(origin).netloc.lower()
+            self._saved_concurrency[local_host] = http_client.host_max_concurrency.get(local_host)
+            http_client.host_max_concurrency[local_host] = http_client.host_max_concurrency.get(
+                upstream_host, http_client.default_max_concurrency)
+
+        overrides = {env_var: self.local_url(env_var) for env_var in self.upstream_urls}
+        if self.disable_cache:
+            overrides["HTTP_CACHE_ENABLED"] = "0"
+        for name, value in overrides.items():
+            self._saved_env[name] = os.environ.get(name)
+            os.environ[name] = value
+        logging.info("Servidor de respuestas grabadas (%s): %s", self.mode, self.urls)
+        return self
+
+    def stop(self):
+        for name, value in self._saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        self._saved_env = {}
+        for host, value in self._saved_concurrency.items():
+            if value is None:
+                http_client.host_max_concurrency.pop(host, None)
+            else:
+                http_client.host_max_concurrency[host] = value
+        self._saved_concurrency = {}
+        for httpd, thread in self._servers:
+            httpd.shutdown()
+            httpd.server_close()
+            thread.join()
+        self._servers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local de respuestas grabadas de las APIs")
+    parser.add_argument("--directory", default=None)
+    parser.add_argument("--record", action="store_true", help="Reenvía y graba las consultas sin grabación")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = ReplayServer(directory=args.directory, mode="record" if args.record else "replay",
+                          latency=args.latency, throttle_rate=args.throttle_rate,
+                          error_rate=args.error_rate, seed=args.seed, port=args.port).start()
+    for env_var in server.upstream_urls:
+        print(f"export {env_var}='{server.local_url(env_var)}'")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
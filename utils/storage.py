@@ -0,0 +1,254 @@
+import os
+import shutil
+import logging
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+#################################################
+#####Almacenamiento de datos intermedios#########
+#################################################
+# Cada etapa del pipeline guarda su resultado en SOURCE_DATA_DIRECTORY como
+# Parquet comprimido con tipos fijos y la siguiente etapa lo lee con los mismos
+# tipos (sin "Unnamed: 0", con los códigos FIPS rellenados con ceros y las
+# columnas de texto como categorías). Si solo existe la versión CSV de un
+# archivo (datos de ejecuciones anteriores) se lee y se tipa igual.
+
+source_data_directory = os.environ.get("SOURCE_DATA_DIRECTORY")
+# "parquet" o "csv"
+storage_format = os.environ.get("SOURCE_DATA_FORMAT", "parquet")
+parquet_compression = os.environ.get("SOURCE_DATA_COMPRESSION", "zstd")
+
+# Esquema común a todos los archivos intermedios (solo se aplica a las columnas presentes)
+category_columns = [
+    "stationTriplet", "stationId", "name", "networkCode", "stateCode",
+    "state_name", "state_alpha", "county_name", "unit_desc",
+]
+# Códigos con ceros a la izquierda: columna -> ancho
+code_columns = {
+    "state_fips_code": 2, "STATEFP": 2, "county_code": 3, "COUNTYFP": 3, "asd_code": 2,
+}
+# county_fips y station_key: llaves enteras de utils/keys.py
+integer_columns = {"year": "int16", "month": "int8", "county_fips": "int32", "station_key": "int32"}
+# Mediciones: float32 es suficiente (las coordenadas se dejan en float64 porque se usan como llaves de merge)
+float32_columns = [
+    "TMAX", "TMIN", "TAVG", "PRCP", "SMS_-8", "WS10M", "RH2M",
+    "phh2o", "ocd", "cec", "sand", "silt", "clay",
+    "Value", "Yield", "CV (%)",
+]
+float64_columns = ["latitude", "longitude", "lat_centroid", "lon_centroid", "elevation"]
+# Valores suprimidos de Quick Stats en Value / CV (%): "(D)", "(Z)", "(NA)", "(X)", ... -> NaN
+quick_stats_placeholder = r"\([A-Z]+\)"
+
+
+class SchemaError(ValueError):
+    """Una columna no se puede convertir al tipo del esquema."""
+
+
+def dataset_path(name: str, file_format: str | None = None, directory: str | None = None) -> str:
+    file_format = file_format or storage_format
+    return os.path.join(directory or source_data_directory, f"{name}.{file_format}")
+
+def _to_code(series, width):
+    # Los códigos leídos de CSV llegan como números (p. ej. 19.0) y pierden los ceros
+    numeric = pd.to_numeric(series, errors="coerce")
+    as_text = numeric.astype("Int64").astype("string")
+    as_text = as_text.where(numeric.notna(), series.astype("string"))
+    return as_text.str.zfill(width).astype("category")
+
+def _to_measurement(series):
+    # Los CSV de Quick Stats traen texto: miles con coma ("1,234") y valores suprimidos ("(D)")
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    text = series.astype("string").str.strip().str.replace(",", "", regex=False)
+    text = text.mask(text.str.fullmatch(quick_stats_placeholder, na=False))
+    return pd.to_numeric(text, errors="raise")
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Devuelve `df` con los tipos del esquema. Elimina las columnas de índice
+    ("Unnamed: 0") que deja `to_csv` con el índice.
+
+    Los valores suprimidos de Quick Stats ("(D)", "(Z)", ...) pasan a NaN; lanza
+    `SchemaError` si una columna numérica del esquema contiene otro texto.
+    """
+    df = df.drop(columns=[c for c in df.columns if str(c).startswith("Unnamed: ")])
+    df = df.copy()
+    for col in df.columns:
+        try:
+            if col in category_columns:
+                if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                    df[col] = df[col].astype("category")
+            elif col in code_columns:
+                df[col] = _to_code(df[col], code_columns[col])
+            elif col in integer_columns:
+                values = pd.to_numeric(df[col], errors="raise")
+                dtype = integer_columns[col]
+                # Con nulos se usa el entero con nulos de pandas (Int16, Int8)
+                df[col] = values.astype(dtype if values.notna().all() else dtype.capitalize())
+            elif col in float32_columns:
+                df[col] = _to_measurement(df[col]).astype("float32")
+            elif col in float64_columns:
+                df[col] = pd.to_numeric(df[col], errors="raise").astype("float64")
+        except (ValueError, TypeError) as e:
+            raise SchemaError(f"La columna {col!r} no cumple el esquema: {e}") from e
+    return df
+
+def memory_usage_mb(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+def untyped_memory_usage_mb(df: pd.DataFrame) -> float:
+    """
+    Memoria que ocuparía `df` con los tipos por defecto de `pd.read_csv`: texto y
+    categorías como object, números como int64/float64. Es la referencia "sin
+    esquema" aunque `df` ya venga tipado desde Parquet.
+    """
+    total = df.index.memory_usage(deep=True)
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype) or not pd.api.types.is_numeric_dtype(values):
+            total += values.astype(object).memory_usage(deep=True, index=False)
+        else:
+            total += 8 * len(values)
+    return total / 1024 ** 2
+
+def _typed(df: pd.DataFrame, name: str, report_memory: bool) -> pd.DataFrame:
+    """Aplica el esquema y, si se pide, muestra la memoria sin esquema y con esquema."""
+    if not report_memory:
+        return apply_schema(df)
+    before = untyped_memory_usage_mb(df)
+    typed = apply_schema(df)
+    after = memory_usage_mb(typed)
+    print(f"📉 Memoria de {name}: {before:.1f} MB sin esquema (tipos de read_csv) -> {after:.1f} MB con esquema "
+          f"({len(typed)} filas, {typed.shape[1]} columnas)")
+    return typed
+
+def save_dataframe(df: pd.DataFrame, name: str, directory: str | None = None) -> str:
+    """
+    Guarda `df` como `name` en el directorio de datos con el esquema aplicado.
+
+    Parámetros:
+        df (pd.DataFrame): Datos a guardar.
+        name (str): Nombre del archivo sin extensión.
+        directory (str, opcional): Carpeta destino (por defecto SOURCE_DATA_DIRECTORY).
+
+    Retorna:
+        str: Ruta del archivo escrito.
+    """
+    directory = directory or source_data_directory
+    os.makedirs(directory, exist_ok=True)
+    df = apply_schema(df.reset_index(drop=True))
+    path = dataset_path(name, directory=directory)
+    if storage_format == "parquet":
+        df.to_parquet(path, index=False, compression=parquet_compression)
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+def read_dataframe(name: str, columns: list[str] | None = None, directory: str | None = None,
+                   report_memory: bool = False) -> pd.DataFrame:
+    """
+    Lee el archivo `name` (Parquet si existe, si no el CSV) con los tipos del esquema.
+
+    Parámetros:
+        name (str): Nombre del archivo sin extensión.
+        columns (list[str], opcional): Solo estas columnas.
+        directory (str, opcional): Carpeta origen (por defecto SOURCE_DATA_DIRECTORY).
+        report_memory (bool, opcional): Muestra la memoria sin esquema (tipos de read_csv) y con esquema.
+
+    Lanza FileNotFoundError si no existe ninguna de las dos versiones.
+    """
+    parquet_path = dataset_path(name, "parquet", directory)
+    csv_path = dataset_path(name, "csv", directory)
+    if os.path.exists(parquet_path):
+        df = pd.read_parquet(parquet_path, columns=columns)
+    elif os.path.exists(csv_path):
+        logging.info("Leyendo %s desde CSV", name)
+        df = pd.read_csv(csv_path, usecols=columns)
+    else:
+        raise FileNotFoundError(f"No existe {parquet_path} ni {csv_path}")
+    return _typed(df, name, report_memory)
+
+def dataset_exists(name: str, directory: str | None = None) -> bool:
+    return any(os.path.exists(dataset_path(name, file_format, directory)) for file_format in ("parquet", "csv"))
+
+#################################################
+#####Dataset de modelado particionado############
+#################################################
+# El dataset final se guarda particionado al estilo Hive por estado y año
+# (<nombre>/state_name=IOWA/year=2015/part-0.parquet). Al leer con filtros de
+# estado/año solo se abren las particiones que coinciden y solo las columnas pedidas.
+
+modeling_dataset_name = "historical_monthly_climate_data_apr_sept_by_scan_stations_and_nasa_final"
+modeling_partition_columns = ["state_name", "year"]
+
+def partitioned_dataset_path(name: str, directory: str | None = None) -> str:
+    return os.path.join(directory or source_data_directory, name)
+
+def save_partitioned_dataframe(df: pd.DataFrame, name: str, partition_columns: list[str],
+                               directory: str | None = None) -> str:
+    """
+    Guarda `df` como dataset Parquet particionado por `partition_columns`.
+    El dataset anterior se reemplaza completo.
+
+    Retorna:
+        str: Carpeta raíz del dataset.
+    """
+    path = partitioned_dataset_path(name, directory)
+    df = apply_schema(df.reset_index(drop=True))
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    df.to_parquet(tmp_path, index=False, partition_cols=partition_columns, compression=parquet_compression)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+def read_partitioned_dataframe(name: str, filters: list[tuple] | None = None, columns: list[str] | None = None,
+                               directory: str | None = None, report_memory: bool = False) -> pd.DataFrame:
+    """
+    Lee un dataset particionado. `filters` usa la sintaxis de pyarrow, p. ej.
+    [("state_name", "in", ["IOWA"]), ("year", ">=", 2010)]; los filtros sobre
+    columnas de partición descartan carpetas completas sin leerlas.
+    """
+    df = pd.read_parquet(partitioned_dataset_path(name, directory), filters=filters or None, columns=columns)
+    # Las columnas de partición vuelven como categorías de pyarrow: se devuelven al tipo del esquema
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and col not in category_columns:
+            df[col] = df[col].astype(df[col].cat.categories.dtype)
+    return _typed(df, name, report_memory)
+
+def save_modeling_dataset(df: pd.DataFrame, directory: str | None = None) -> str:
+    return save_partitioned_dataframe(df, modeling_dataset_name, modeling_partition_columns, directory)
+
+def load_modeling_dataset(states: list[str] | None = None, years: list[int] | None = None,
+                          columns: list[str] | None = None, directory: str | None = None,
+                          report_memory: bool = True) -> pd.DataFrame:
+    """
+    Cargador común del dataset de modelado (scripts de model_selection/ y eda/).
+    Lee solo las particiones y columnas necesarias y devuelve los tipos del
+    esquema (categorías, float32, enteros pequeños, sin "Unnamed: 0").
+
+    Parámetros:
+        states (list[str], opcional): Valores de `state_name` (p. ej. ["IOWA", "ILLINOIS"]).
+        years (list[int], opcional): Años a cargar.
+        columns (list[str], opcional): Columnas a cargar (por defecto todas).
+        directory (str, opcional): Carpeta de datos (por defecto SOURCE_DATA_DIRECTORY).
+        report_memory (bool, opcional): Muestra la memoria sin esquema (tipos de read_csv) y con esquema.
+
+    Si el dataset particionado no existe o es más antiguo que el archivo plano
+    (`<modeling_dataset_name>.csv`/`.parquet`), se genera antes a partir de este.
+    """
+    path = partitioned_dataset_path(modeling_dataset_name, directory)
+    flat_paths = [dataset_path(modeling_dataset_name, file_format, directory) for file_format in ("parquet", "csv")]
+    flat_mtime = max((os.path.getmtime(p) for p in flat_paths if os.path.exists(p)), default=None)
+    if flat_mtime is not None and (not os.path.isdir(path) or os.path.getmtime(path) < flat_mtime):
+        logging.info("Generando el dataset particionado %s", path)
+        save_modeling_dataset(read_dataframe(modeling_dataset_name, directory=directory, report_memory=report_memory), directory)
+
+    filters = []
+    if states is not None:
+        filters.append(("state_name", "in", list(states)))
+    if years is not None:
+        filters.append(("year", "in", [int(year) for year in years]))
+    return read_partitioned_dataframe(modeling_dataset_name, filters, columns, directory, report_memory)
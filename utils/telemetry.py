@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import math
+import threading
+from collections import Counter
+
+#################################################
+#####Telemetría de la ingesta por endpoint#######
+#################################################
+# `utils.http_client` registra aquí cada intento de consulta y cada acceso a
+# la caché. Al final de main.py se escribe un reporte JSON y un archivo de
+# texto en formato Prometheus (node_exporter textfile collector).
+
+# Cuantiles que se reportan de la latencia
+latency_quantiles = (0.5, 0.95, 0.99)
+
+_lock = threading.Lock()
+_endpoints = {}
+_started = time.time()
+
+
+class _EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.statuses = Counter()
+        self.errors = 0            # excepciones de red (sin respuesta)
+        self.retries = 0
+        self.throttled = 0         # respuestas 429
+        self.bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.latencies = []        # segundos por intento
+
+    def to_dict(self):
+        cache_total = self.cache_hits + self.cache_misses
+        latencies = sorted(self.latencies)
+        return {
+            "requests": self.requests,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "errors": self.errors,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "bytes": self.bytes,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_rate": self.cache_hits / cache_total if cache_total else None,
+            "latency_seconds": {
+                "total": sum(latencies),
+                "max": latencies[-1] if latencies else None,
+                **{f"p{int(q * 100)}": _quantile(latencies, q) for q in latency_quantiles},
+            },
+        }
+
+
+def _quantile(sorted_values, q):
+    """Cuantil por rango más cercano de una lista ya ordenada."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def _get(endpoint):
+    stats = _endpoints.get(endpoint)
+    if stats is None:
+        stats = _endpoints[endpoint] = _EndpointStats()
+    return stats
+
+def record_request(endpoint: str, latency: float, status: int | None = None, nbytes: int = 0,
+                   retry: bool = False) -> None:
+    """Registra un intento de consulta. `status` None indica un error de red."""
+    with _lock:
+        stats = _get(endpoint)
+        stats.requests += 1
+        stats.latencies.append(latency)
+        stats.bytes += nbytes
+        if retry:
+            stats.retries += 1
+        if status is None:
+            stats.errors += 1
+        else:
+            stats.statuses[status] += 1
+            if status == 429:
+                stats.throttled += 1
+
+def record_cache(endpoint: str, hit: bool) -> None:
+    with _lock:
+        stats = _get(endpoint)
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+def reset() -> None:
+    global _started
+    with _lock:
+        _endpoints.clear()
+        _started = time.time()
+
+def snapshot() -> dict:
+    """Devuelve las métricas acumuladas desde el inicio (o el último `reset`)."""
+    with _lock:
+        return {
+            "started": _started,
+            "wall_time_seconds": time.time() - _started,
+            "endpoints": {endpoint: stats.to_dict() for endpoint, stats in sorted(_endpoints.items())},
+        }
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def to_prometheus(report: dict) -> str:
+    """Convierte un `snapshot()` al formato de texto de Prometheus."""
+    metrics = [
+        ("ingestion_http_requests_total", "counter", "Intentos de consulta por endpoint y estado", []),
+        ("ingestion_http_errors_total", "counter", "Errores de red sin respuesta", []),
+        ("ingestion_http_retries_total", "counter", "Reintentos", []),
+        ("ingestion_http_throttled_total", "counter", "Respuestas 429", []),
+        ("ingestion_http_response_bytes_total", "counter", "Bytes recibidos", []),
+        ("ingestion_http_cache_hits_total", "counter", "Consultas servidas desde la caché en disco", []),
+        ("ingestion_http_cache_misses_total", "counter", "Consultas que no estaban en la caché", []),
+        ("ingestion_http_request_duration_seconds", "summary", "Latencia por intento", []),
+    ]
+    samples = {name: lines for name, _, _, lines in metrics}
+    for endpoint, stats in report["endpoints"].items():
+        label = f'endpoint="{_escape_label(endpoint)}"'
+        for status, count in stats["statuses"].items():
+            samples["ingestion_http_requests_total"].append(f'{{{label},status="{status}"}} {count}')
+        if stats["errors"]:
+            samples["ingestion_http_requests_total"].append(f'{{{label},status="error"}} {stats["errors"]}')
+        samples["ingestion_http_errors_total"].append(f"{{{label}}} {stats['errors']}")
+        samples["ingestion_http_retries_total"].append(f"{{{label}}} {stats['retries']}")
+        samples["ingestion_http_throttled_total"].append(f"{{{label}}} {stats['throttled']}")
+        samples["ingestion_http_response_bytes_total"].append(f"{{{label}}} {stats['bytes']}")
+        samples["ingestion_http_cache_hits_total"].append(f"{{{label}}} {stats['cache_hits']}")
+        samples["ingestion_http_cache_misses_total"].append(f"{{{label}}} {stats['cache_misses']}")
+        latency = stats["latency_seconds"]
+        duration = samples["ingestion_http_request_duration_seconds"]
+        for q in latency_quantiles:
+            value = latency[f"p{int(q * 100)}"]
+            if value is not None:
+                duration.append(f'{{{label},quantile="{q}"}} {value}')
+        duration.append(f"_sum{{{label}}} {latency['total']}")
+        duration.append(f"_count{{{label}}} {stats['requests']}")
+
+    lines = []
+    for name, metric_type, help_text, metric_samples in metrics:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for sample in metric_samples:
+            # Las líneas _sum/_count llevan el sufijo pegado al nombre
+            lines.append(f"{name}{sample}")
+    lines.append("# HELP ingestion_run_wall_time_seconds Duración de la ejecución")
+    lines.append("# TYPE ingestion_run_wall_time_seconds gauge")
+    lines.append(f"ingestion_run_wall_time_seconds {report['wall_time_seconds']}")
+    return "\n".join(lines) + "\n"
+
+def write_report(json_path: str, prometheus_path: str | None = None) -> dict:
+    """
+    Escribe el reporte de la ejecución en `json_path` y, si se indica, las
+    mismas métricas en formato Prometheus en `prometheus_path`.
+
+    Retorna:
+        dict: El reporte escrito.
+    """
+    report = snapshot()
+    for path in (json_path, prometheus_path):
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    if prometheus_path:
+        # Escritura atómica: el colector de Prometheus puede leer el archivo en cualquier momento
+        tmp_path = f"{prometheus_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(to_prometheus(report))
+        os.replace(tmp_path, prometheus_path)
+    return report